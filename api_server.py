@@ -1,60 +1,574 @@
-from flask import Flask, jsonify, request
+from flask import Flask, g, has_request_context, jsonify, request, stream_with_context
+from flask.json.provider import JSONProvider
+from flask_compress import Compress
 from flask_cors import CORS
+from werkzeug.http import http_date
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+import orjson
 import psycopg2
 import psycopg2.extras
+from psycopg2.pool import ThreadedConnectionPool, PoolError
+from cachetools import TLRUCache
+import hashlib
+import itertools
 import logging
-from datetime import datetime, timedelta
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import lru_cache
+from operator import itemgetter
+from datetime import date, datetime, timedelta
+from decimal import Decimal
 from config import Config
+from database import TimescaleDBManager
 from equiweighted_index import EquiweightedIndexGenerator
 
+def record_timing(phase, started):
+    """Add the time since started (a perf_counter value) to a Server-Timing phase"""
+    if has_request_context():
+        timings = g.setdefault('timings', {})
+        timings[phase] = timings.get(phase, 0.0) + time.perf_counter() - started
+
+class OrjsonProvider(JSONProvider):
+    """JSON provider backed by orjson, matching Flask's default output"""
+    
+    # Streamed rows let orjson encode datetimes natively as ISO 8601; jsonify
+    # keeps Flask's HTTP-date format for them
+    stream_option = orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+    option = stream_option | orjson.OPT_PASSTHROUGH_DATETIME
+    
+    @staticmethod
+    def default(obj):
+        if isinstance(obj, Decimal):
+            return str(obj)
+        if isinstance(obj, date):
+            return http_date(obj)
+        raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+    
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default, option=self.option).decode()
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+    
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        started = time.perf_counter()
+        body = orjson.dumps(obj, default=self.default, option=self.option)
+        record_timing('json_encode', started)
+        return self._app.response_class(body, mimetype="application/json")
+
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 CORS(app)  # Enable CORS for React frontend
 
+# Compress JSON bodies over 1 KB; streamed responses are compressed chunk by chunk
+app.config.update(
+    COMPRESS_ALGORITHM=['br', 'gzip'],
+    COMPRESS_ALGORITHM_STREAMING=['br', 'deflate'],
+    COMPRESS_MIN_SIZE=1024,
+    COMPRESS_BR_LEVEL=4
+)
+Compress(app)
+
+@app.before_request
+def start_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def add_server_timing(response):
+    """Report where the request spent its time (db_connect, db, json_encode, total)"""
+    timings = g.get('timings', {})
+    if 'request_started' in g:
+        timings['total'] = time.perf_counter() - g.request_started
+    if timings:
+        response.headers['Server-Timing'] = ', '.join(
+            f"{phase};dur={seconds * 1000:.1f}" for phase, seconds in timings.items()
+        )
+    return response
+
 # Setup logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Sectors, industries and stats only change when stocks are re-ingested
+LOOKUP_CACHE_TTL = 300
+STATS_CACHE_TTL = 60
+# Index names only change when indices are generated, which invalidates them
+INDEX_CACHE_TTL = 900
+# Bounds the cache, since keys include client-supplied sector names
+CACHE_MAX_ENTRIES = 256
+
+# Decode json/jsonb columns (e.g. EXPLAIN output) with orjson
+psycopg2.extras.register_default_json(globally=True, loads=orjson.loads)
+psycopg2.extras.register_default_jsonb(globally=True, loads=orjson.loads)
+
+# NUMERIC columns as float, for routes that return prices as JSON numbers anyway
+DEC2FLOAT = psycopg2.extensions.new_type(
+    psycopg2.extensions.DECIMAL.values,
+    'DEC2FLOAT',
+    lambda value, cursor: float(value) if value is not None else None
+)
+
+# to_char() format matching datetime.isoformat() at whole seconds, so price
+# timestamps arrive as ready-to-send strings
+ISO_TIMESTAMP_FORMAT = 'YYYY-MM-DD"T"HH24:MI:SSTZH:TZM'
+
+# Rows fetched per round trip by the server-side cursors behind streamed responses
+STREAM_ITERSIZE = 5000
+
+# Bounds on client-supplied pagination
+MAX_LIMIT = 200
+MAX_SEARCH_LIMIT = 50
+MAX_OFFSET = 10000
+
+# Hot lookups, prepared once per pooled connection and run with EXECUTE
+PREPARED_STATEMENTS = {
+    'q_sectors': """
+        SELECT DISTINCT sector
+        FROM stocks 
+        WHERE sector IS NOT NULL AND sector != ''
+        ORDER BY sector
+    """,
+    'q_industries': """
+        SELECT DISTINCT industry
+        FROM stocks 
+        WHERE industry IS NOT NULL AND industry != ''
+        ORDER BY industry
+    """,
+    'q_industries_for_sector': """
+        SELECT DISTINCT industry
+        FROM stocks 
+        WHERE sector = $1 
+          AND industry IS NOT NULL 
+          AND industry != ''
+        ORDER BY industry
+    """,
+    'q_industries_by_sector': """
+        SELECT sector, industry
+        FROM stocks 
+        WHERE sector = ANY($1) 
+          AND industry IS NOT NULL 
+          AND industry != ''
+        GROUP BY sector, industry
+        ORDER BY sector, industry
+    """,
+    'q_search': """
+        SELECT 
+            symbol,
+            company_name,
+            sector,
+            industry,
+            market_cap
+        FROM stocks 
+        WHERE 
+            search_tsv @@ plainto_tsquery('simple', $4)
+            OR symbol ILIKE $1 
+            OR company_name ILIKE $1
+            -- Trigram similarity also catches misspelt names
+            OR symbol % $4
+            OR company_name % $4
+        ORDER BY 
+            CASE 
+                WHEN symbol ILIKE $2 THEN 1
+                WHEN company_name ILIKE $2 THEN 2
+                ELSE 3
+            END,
+            ts_rank(search_tsv, plainto_tsquery('simple', $4)) DESC,
+            similarity(sort_name, $4) DESC,
+            sort_name
+        LIMIT $3
+    """,
+    'q_stocks_by_sector_industry': """
+        SELECT 
+            symbol,
+            company_name,
+            sector,
+            industry,
+            market_cap
+        FROM stocks 
+        WHERE sector = $1 AND industry = $2
+        ORDER BY 
+            CASE WHEN market_cap IS NOT NULL THEN market_cap ELSE 0 END DESC,
+            sort_name
+    """,
+    'q_stage_stocks_by_symbols': """
+        SELECT symbol, company_name, sector, industry, market_cap
+        FROM stocks 
+        WHERE symbol = ANY($1)
+        ORDER BY symbol
+    """,
+    'q_stage_stocks_by_sector_industry': """
+        SELECT symbol, company_name, sector, industry, market_cap
+        FROM stocks 
+        WHERE sector = $1 AND industry = $2
+        ORDER BY symbol
+    """,
+    'q_stage_prices': f"""
+        SELECT symbol, to_char(time, '{ISO_TIMESTAMP_FORMAT}') as time, close_price
+        FROM stock_prices 
+        WHERE symbol = ANY($1) 
+          AND time >= NOW() - INTERVAL '1 year'
+        ORDER BY symbol, stock_prices.time ASC
+    """,
+    # Stock info and price history in one round trip; a stock without prices
+    # in the window still yields one row with NULL time
+    'q_price_history_detailed': f"""
+        SELECT 
+            s.symbol, s.company_name, s.sector, s.industry, s.market_cap,
+            to_char(p.time, '{ISO_TIMESTAMP_FORMAT}') as time, p.close_price
+        FROM stocks s
+        LEFT JOIN stock_prices p 
+          ON p.symbol = s.symbol 
+         AND p.time >= NOW() - ($2 * INTERVAL '1 day')
+        WHERE s.symbol = $1
+        ORDER BY p.time ASC
+    """,
+}
+
+# One /api/companies page query and one total count per filter combination
+COMPANY_FILTERS = [(), ('sector',), ('industry',), ('sector', 'industry')]
+
+def _companies_statement_name(filters, prefix='q_companies'):
+    return prefix + ''.join(f'_by_{column}' for column in filters)
+
+def _companies_where(filters):
+    where = " AND ".join(f"{column} = ${i}" for i, column in enumerate(filters, 1))
+    return "WHERE " + where if where else ""
+
+def _companies_statement(filters):
+    return f"""
+        SELECT 
+            symbol,
+            company_name,
+            sector,
+            industry,
+            market_cap
+        FROM stocks 
+        {_companies_where(filters)}
+        ORDER BY sort_name, symbol
+        LIMIT ${len(filters) + 1} OFFSET ${len(filters) + 2}
+    """
+
+def _companies_count_statement(filters):
+    return f"""
+        SELECT COUNT(*)
+        FROM stocks 
+        {_companies_where(filters)}
+    """
+
+for filters in COMPANY_FILTERS:
+    PREPARED_STATEMENTS[_companies_statement_name(filters)] = _companies_statement(filters)
+    PREPARED_STATEMENTS[_companies_statement_name(filters, 'q_companies_count')] = _companies_count_statement(filters)
+
+# The same statements with psycopg2 placeholders, for when preparing is disabled
+INLINE_STATEMENTS = {
+    name: re.sub(r'\$(\d+)', r'%(\1)s', sql.replace('%', '%%'))
+    for name, sql in PREPARED_STATEMENTS.items()
+}
+
+class PreparedConnection(psycopg2.extensions.connection):
+    """Pooled connection that tracks which PREPARED_STATEMENTS exist on its session"""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Statement name -> True once prepared, False if preparing it failed
+        self.prepared = {}
+
 class StockAPI:
     def __init__(self):
         self.config = Config()
-    
-    def get_db_connection(self):
-        """Get database connection"""
-        return psycopg2.connect(
-            host=self.config.DB_HOST,
-            port=self.config.DB_PORT,
-            database=self.config.DB_NAME,
-            user=self.config.DB_USER,
-            password=self.config.DB_PASSWORD
-        )
+        self.pool = None
+        self._pool_lock = threading.Lock()
+        # Requests beyond DB_POOL_MAX wait for a free connection instead of
+        # failing with "connection pool exhausted"
+        self._pool_slots = threading.BoundedSemaphore(self.config.DB_POOL_MAX)
+        # Entries are (ttl, value) pairs that expire ttl seconds after insertion
+        self._cache = TLRUCache(maxsize=CACHE_MAX_ENTRIES, ttu=lambda key, entry, now: now + entry[0])
+        self._cache_lock = threading.Lock()
+
+    def get_pool(self):
+        """Get the shared connection pool, creating it on first use"""
+        if self.pool is None:
+            with self._pool_lock:
+                if self.pool is None:
+                    self.pool = ThreadedConnectionPool(
+                        self.config.DB_POOL_MIN,
+                        self.config.DB_POOL_MAX,
+                        host=self.config.DB_HOST,
+                        port=self.config.DB_PORT,
+                        database=self.config.DB_NAME,
+                        user=self.config.DB_USER,
+                        password=self.config.DB_PASSWORD,
+                        connection_factory=PreparedConnection
+                    )
+        return self.pool
+
+    def _prepare(self, cursor, name):
+        """
+        Prepare one statement on the cursor's session the first time it is used
+        
+        A statement that can't be prepared (e.g. a column from a pending
+        migration is missing) is run inline from then on, so it doesn't take
+        the other statements on the connection down with it.
+        """
+        prepared = cursor.connection.prepared
+        cursor.execute("SAVEPOINT prepare_statement")
+        try:
+            cursor.execute(f"PREPARE {name} AS {PREPARED_STATEMENTS[name]}")
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            raise
+        except psycopg2.Error as e:
+            cursor.execute("ROLLBACK TO SAVEPOINT prepare_statement")
+            logger.warning(f"Could not prepare {name}, running it inline: {e}")
+            prepared[name] = False
+        else:
+            cursor.execute("RELEASE SAVEPOINT prepare_statement")
+            prepared[name] = True
+        return prepared[name]
+
+    @contextmanager
+    def connection(self):
+        """Borrow a database connection from the pool"""
+        started = time.perf_counter()
+        if not self._pool_slots.acquire(timeout=self.config.DB_POOL_TIMEOUT):
+            raise PoolError("Timed out waiting for a database connection")
+        try:
+            pool = self.get_pool()
+            conn = pool.getconn()
+            broken = False
+            try:
+                record_timing('db_connect', started)
+                started = time.perf_counter()
+                yield conn
+                conn.commit()
+            except (psycopg2.OperationalError, psycopg2.InterfaceError):
+                # Dead or desynchronised connection: drop it rather than reuse it
+                broken = True
+                raise
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                pool.putconn(conn, close=broken or bool(conn.closed))
+                record_timing('db', started)
+        finally:
+            self._pool_slots.release()
+
+    @contextmanager
+    def cursor(self, dict_rows=True, name=None):
+        """Borrow a pooled connection and open a cursor on it (dict rows by default)"""
+        cursor_factory = psycopg2.extras.RealDictCursor if dict_rows else None
+        with self.connection() as conn, conn.cursor(name=name, cursor_factory=cursor_factory) as cursor:
+            yield cursor
+
+    def execute(self, cursor, name, params=()):
+        """Run one of PREPARED_STATEMENTS, inline when preparing is disabled or failed"""
+        prepared = self.config.DB_PREPARE_STATEMENTS
+        if prepared:
+            prepared = cursor.connection.prepared.get(name)
+            if prepared is None:
+                prepared = self._prepare(cursor, name)
+        
+        if not prepared:
+            cursor.execute(INLINE_STATEMENTS[name], {str(i): p for i, p in enumerate(params, 1)})
+        elif params:
+            cursor.execute(f"EXECUTE {name}({', '.join(['%s'] * len(params))})", params)
+        else:
+            cursor.execute(f"EXECUTE {name}")
+
+    def invalidate(self, *keys):
+        """Drop cached entries so the next request re-queries them"""
+        with self._cache_lock:
+            for key in keys:
+                self._cache.pop(key, None)
+
+    def cached(self, key, ttl, fetch):
+        """Return fetch() from the in-process cache, refreshing it every ttl seconds"""
+        with self._cache_lock:
+            entry = self._cache.get(key)
+        if entry:
+            return entry[1]
+        
+        value = fetch()
+        with self._cache_lock:
+            self._cache[key] = (ttl, value)
+        return value
 
 stock_api = StockAPI()
 
+# Index generation runs on a single background worker, so repeated POSTs
+# don't start overlapping full re-indexes; index_generation tracks the latest run
+# and whether this process has already set up the index table
+index_generation_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='index-generation')
+index_generation_lock = threading.Lock()
+index_generation = {'job': None, 'started_at': None, 'finished_at': None, 'table_ready': False}
+
+@lru_cache(maxsize=1)
+def index_generator():
+    """Shared index generator; only used by the single generation worker"""
+    return EquiweightedIndexGenerator()
+
+def refresh_materialized_views_periodically(interval):
+    """Refresh the stats views every interval seconds, covering stock writes made outside main.py"""
+    while True:
+        time.sleep(interval)
+        try:
+            db = TimescaleDBManager()
+            try:
+                # Each gunicorn worker runs this loop; refreshes are skipped
+                # while another worker's is running or was made less than an
+                # interval ago, so the views refresh about once per interval.
+                # The 10% margin keeps timer jitter from skipping the worker
+                # whose own previous refresh set refreshed_at
+                if db.connect():
+                    db.refresh_materialized_views(min_interval=interval * 0.9)
+            finally:
+                db.close()
+            stock_api.invalidate('stats', 'sector_industry_combinations')
+        except Exception as e:
+            logger.error(f"Error refreshing materialized views: {e}")
+
+_mv_refresh_started = False
+_mv_refresh_lock = threading.Lock()
+
+def start_materialized_view_refresh():
+    """
+    Start the background view refresh once per process
+    
+    Called from the server entry points (wsgi.py and __main__) rather than on
+    import, so scripts importing this module don't start refresh loops.
+    """
+    global _mv_refresh_started
+    interval = stock_api.config.MV_REFRESH_INTERVAL
+    with _mv_refresh_lock:
+        if _mv_refresh_started or interval <= 0:
+            return
+        _mv_refresh_started = True
+    
+    threading.Thread(
+        target=refresh_materialized_views_periodically,
+        args=(interval,),
+        name='mv-refresh',
+        daemon=True
+    ).start()
+
+def cached_json_response(key, ttl, fetch, raw=False):
+    """
+    Serve {'success': True, 'data': fetch()} from the in-process cache
+    
+    The encoded body and its ETag are cached together; clients may reuse the
+    response for ttl seconds and get a 304 when their If-None-Match matches.
+    With raw=True fetch() already returns the data as JSON text.
+    """
+    def build():
+        if raw:
+            body = b'{"data":' + fetch().encode() + b',"success":true}'
+        else:
+            body = jsonify({'success': True, 'data': fetch()}).get_data()
+        return body, hashlib.blake2b(body, digest_size=16).hexdigest()
+    
+    body, etag = stock_api.cached(key, ttl, build)
+    
+    # Flask-Compress suffixes the ETag of compressed bodies with the encoding
+    # ("<hash>:br"), so compare on the hash alone
+    client_etags = {tag.partition(':')[0] for tag in request.if_none_match.as_set()}
+    if etag in client_etags:
+        response = app.response_class(status=304)
+    else:
+        response = app.response_class(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = ttl
+    return response
+
+@lru_cache(maxsize=2048)
+def _parse_day(value):
+    """Parse a YYYY-MM-DD query parameter (None when not provided)"""
+    return datetime.fromisoformat(value) if value else None
+
+def stream_rows(query, params, dec2float=False):
+    """
+    Yield rows of query from a server-side cursor
+    
+    The pooled connection is held until the generator is exhausted or closed,
+    so large results are never materialized in memory at once.
+    """
+    with stock_api.cursor(dict_rows=False, name=f"stream_{uuid.uuid4().hex}") as cursor:
+        cursor.itersize = STREAM_ITERSIZE
+        if dec2float:
+            psycopg2.extensions.register_type(DEC2FLOAT, cursor)
+        cursor.execute(query, params)
+        
+        # Plain tuples zipped into dicts are cheaper than RealDictRow objects
+        columns = None
+        for row in cursor:
+            if columns is None:
+                columns = [column.name for column in cursor.description]
+            yield dict(zip(columns, row))
+
+def stream_json_response(rows):
+    """Stream {'success': True, 'data': [rows]} without building the whole body"""
+    # Run the query before the response starts so errors still become a 500
+    rows = iter(rows)
+    first = next(rows, None)
+    if first is not None:
+        rows = itertools.chain([first], rows)
+    
+    def generate():
+        yield b'{"data":['
+        for i, row in enumerate(rows):
+            yield (b',' if i else b'') + orjson.dumps(
+                row, default=OrjsonProvider.default, option=OrjsonProvider.stream_option
+            )
+        yield b'],"success":true}'
+    
+    return app.response_class(stream_with_context(generate()), mimetype='application/json')
+
+def iso_json_response(payload):
+    """Encode payload in one orjson pass, with datetimes as ISO 8601 like streamed rows"""
+    started = time.perf_counter()
+    body = orjson.dumps(payload, default=OrjsonProvider.default, option=OrjsonProvider.stream_option)
+    record_timing('json_encode', started)
+    return app.response_class(body, mimetype='application/json')
+
 # BASIC STOCK DATA ENDPOINTS
 
+def _fetch_sectors():
+    """Query all unique sectors"""
+    with stock_api.cursor(dict_rows=False) as cursor:
+        stock_api.execute(cursor, 'q_sectors')
+        
+        return [sector for (sector,) in cursor]
+
+def _fetch_industries(sector):
+    """Query industries, optionally limited to one sector"""
+    with stock_api.cursor(dict_rows=False) as cursor:
+        if sector:
+            stock_api.execute(cursor, 'q_industries_for_sector', (sector,))
+        else:
+            stock_api.execute(cursor, 'q_industries')
+        
+        return [industry for (industry,) in cursor]
+
+def _fetch_industries_by_sector(sectors):
+    """Query industries for several sectors at once, grouped by sector"""
+    with stock_api.cursor(dict_rows=False) as cursor:
+        stock_api.execute(cursor, 'q_industries_by_sector', (sectors,))
+        
+        industries = {sector: [] for sector in sectors}
+        for sector, industry in cursor:
+            industries[sector].append(industry)
+        return industries
+
 @app.route('/api/sectors', methods=['GET'])
 def get_sectors():
     """Get all unique sectors"""
     try:
-        conn = stock_api.get_db_connection()
-        cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-        
-        cursor.execute("""
-            SELECT DISTINCT sector
-            FROM stocks 
-            WHERE sector IS NOT NULL AND sector != ''
-            ORDER BY sector
-        """)
-        
-        sectors = [row['sector'] for row in cursor.fetchall()]
-        
-        cursor.close()
-        conn.close()
-        
-        return jsonify({
-            'success': True,
-            'data': sectors
-        })
+        return cached_json_response('sectors', LOOKUP_CACHE_TTL, _fetch_sectors)
         
     except Exception as e:
         logger.error(f"Error fetching sectors: {e}")
@@ -65,39 +579,26 @@ def get_sectors():
 
 @app.route('/api/industries', methods=['GET'])
 def get_industries():
-    """Get industries for a specific sector"""
+    """
+    Get industries for a specific sector
+    
+    ``sectors=a,b,c`` returns a ``{sector: [industries]}`` map for several
+    sectors in one call.
+    """
     sector = request.args.get('sector')
+    sectors = sorted({s.strip() for s in request.args.get('sectors', '').split(',') if s.strip()})
     
     try:
-        conn = stock_api.get_db_connection()
-        cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-        
-        if sector:
-            cursor.execute("""
-                SELECT DISTINCT industry
-                FROM stocks 
-                WHERE sector = %s 
-                  AND industry IS NOT NULL 
-                  AND industry != ''
-                ORDER BY industry
-            """, (sector,))
-        else:
-            cursor.execute("""
-                SELECT DISTINCT industry
-                FROM stocks 
-                WHERE industry IS NOT NULL AND industry != ''
-                ORDER BY industry
-            """)
-        
-        industries = [row['industry'] for row in cursor.fetchall()]
-        
-        cursor.close()
-        conn.close()
-        
-        return jsonify({
-            'success': True,
-            'data': industries
-        })
+        if sectors:
+            return cached_json_response(
+                f"industries_by_sector:{','.join(sectors)}", LOOKUP_CACHE_TTL,
+                lambda: _fetch_industries_by_sector(sectors)
+            )
+        
+        return cached_json_response(
+            f"industries:{sector or '*'}", LOOKUP_CACHE_TTL,
+            lambda: _fetch_industries(sector)
+        )
         
     except Exception as e:
         logger.error(f"Error fetching industries: {e}")
@@ -108,76 +609,119 @@ def get_industries():
 
 @app.route('/api/companies', methods=['GET'])
 def get_companies():
-    """Get companies filtered by sector and/or industry"""
+    """
+    Get companies filtered by sector and/or industry
+    
+    Pages are addressed either by ``page`` (offset pagination with a total
+    count) or by ``after``, the ``next_after`` cursor of the previous response
+    (keyset pagination, pass an empty value for the first page).
+    
+    With ``count=estimate`` page mode reports the planner's row estimate as
+    the total instead of counting the matching rows.
+    """
     sector = request.args.get('sector')
     industry = request.args.get('industry')
-    page = int(request.args.get('page', 1))
-    limit = int(request.args.get('limit', 50))
-    offset = (page - 1) * limit
+    after = request.args.get('after')
+    estimate_count = request.args.get('count') == 'estimate'
+    try:
+        page = int(request.args.get('page', 1))
+        limit = min(max(int(request.args.get('limit', 50)), 1), MAX_LIMIT)
+    except ValueError:
+        return jsonify({
+            'success': False,
+            'error': 'page and limit must be integers'
+        }), 400
+    
+    offset = (page - 1) * limit if after is None else 0
+    if page < 1 or offset > MAX_OFFSET:
+        return jsonify({
+            'success': False,
+            'error': f'page must be between 1 and {MAX_OFFSET // limit + 1}; use after for deeper pages'
+        }), 400
     
     try:
-        conn = stock_api.get_db_connection()
-        cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-        
-        # Build dynamic query based on filters
-        where_conditions = []
-        params = []
-        
-        if sector:
-            where_conditions.append("sector = %s")
-            params.append(sector)
-        
-        if industry:
-            where_conditions.append("industry = %s")
-            params.append(industry)
-        
-        where_clause = ""
-        if where_conditions:
-            where_clause = "WHERE " + " AND ".join(where_conditions)
-        
-        # Get total count
-        count_query = f"""
-            SELECT COUNT(*) as total
-            FROM stocks 
-            {where_clause}
-        """
-        cursor.execute(count_query, params)
-        total = cursor.fetchone()['total']
-        
-        # Get paginated results
-        data_query = f"""
-            SELECT 
-                symbol,
-                company_name,
-                sector,
-                industry,
-                market_cap
-            FROM stocks 
-            {where_clause}
-            ORDER BY 
-                CASE WHEN company_name IS NOT NULL AND company_name != '' 
-                     THEN company_name 
-                     ELSE symbol 
-                END
-            LIMIT %s OFFSET %s
-        """
-        
-        cursor.execute(data_query, params + [limit, offset])
-        companies = cursor.fetchall()
-        
-        cursor.close()
-        conn.close()
+        with stock_api.cursor(dict_rows=False) as cursor:
+            # Build dynamic query based on filters
+            filters = tuple(column for column, value in (('sector', sector), ('industry', industry)) if value)
+            where_conditions = [f"{column} = %s" for column in filters]
+            params = [value for value in (sector, industry) if value]
+
+            where_clause = ""
+            if where_conditions:
+                where_clause = "WHERE " + " AND ".join(where_conditions)
+
+            total = None
+            if after is None and not estimate_count:
+                # Page from the prepared statement; the filtered total is
+                # counted at most once per STATS_CACHE_TTL
+                def count_companies():
+                    stock_api.execute(cursor, _companies_statement_name(filters, 'q_companies_count'), params)
+                    return cursor.fetchone()[0]
+                
+                total = stock_api.cached(('companies_total', sector, industry), STATS_CACHE_TTL, count_companies)
+                
+                stock_api.execute(cursor, _companies_statement_name(filters), params + [limit, offset])
+                rows = cursor.fetchall()
+            else:
+                if after is not None:
+                    # Seek past the last row of the previous page
+                    after_name, _, after_symbol = after.rpartition(',')
+                    where_conditions.append("(sort_name, symbol) > (%s, %s)")
+                    params.extend([after_name, after_symbol])
+                    where_clause = "WHERE " + " AND ".join(where_conditions)
+                else:
+                    # Planner estimate from table statistics, no scan of the matches
+                    cursor.execute(f"EXPLAIN (FORMAT JSON) SELECT 1 FROM stocks {where_clause}", params)
+                    total = int(cursor.fetchone()[0][0]['Plan']['Plan Rows'])
+
+                # Get paginated results
+                data_query = f"""
+                    SELECT 
+                        symbol,
+                        company_name,
+                        sector,
+                        industry,
+                        market_cap,
+                        sort_name
+                    FROM stocks 
+                    {where_clause}
+                    ORDER BY sort_name, symbol
+                    LIMIT %s OFFSET %s
+                """
+
+                cursor.execute(data_query, params + [limit, offset])
+                rows = cursor.fetchall()
+        
+        companies = [
+            {'symbol': r[0], 'company_name': r[1], 'sector': r[2], 'industry': r[3], 'market_cap': r[4]}
+            for r in rows
+        ]
+        
+        if after is None:
+            pagination = {
+                'total': total,
+                'page': page,
+                'limit': limit,
+                'pages': (total + limit - 1) // limit
+            }
+            if estimate_count:
+                pagination['estimated'] = True
+        else:
+            next_after = None
+            if len(rows) == limit:
+                # Built from the stored sort_name, so the seek matches the ORDER BY exactly
+                last = rows[-1]
+                next_after = f"{last[5]},{last[0]}"
+            pagination = {
+                'limit': limit,
+                'next_after': next_after
+            }
         
         return jsonify({
             'success': True,
             'data': {
                 'companies': companies,
-                'pagination': {
-                    'total': total,
-                    'page': page,
-                    'limit': limit,
-                    'pages': (total + limit - 1) // limit
-                }
+                'pagination': pagination
             }
         })
         
@@ -188,47 +732,32 @@ def get_companies():
             'error': str(e)
         }), 500
 
+def _fetch_stats():
+    """Build the stats payload (overall counts and largest sectors) as JSON text"""
+    with stock_api.cursor(dict_rows=False) as cursor:
+        # Views are precomputed by database.refresh_materialized_views
+        cursor.execute("""
+            SELECT json_build_object(
+                'overall', (SELECT row_to_json(s) FROM mv_stock_stats s),
+                'top_sectors', COALESCE((
+                    SELECT json_agg(t ORDER BY t.count DESC, t.sector)
+                    FROM (
+                        SELECT sector, count
+                        FROM mv_top_sectors 
+                        ORDER BY count DESC, sector 
+                        LIMIT 10
+                    ) t
+                ), '[]'::json)
+            )::text
+        """)
+        
+        return cursor.fetchone()[0]
+
 @app.route('/api/stats', methods=['GET'])
 def get_stats():
     """Get database statistics"""
     try:
-        conn = stock_api.get_db_connection()
-        cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-        
-        # Get overall stats
-        cursor.execute("""
-            SELECT 
-                COUNT(*) as total_stocks,
-                COUNT(CASE WHEN sector IS NOT NULL AND sector != '' THEN 1 END) as stocks_with_sector,
-                COUNT(DISTINCT sector) as unique_sectors,
-                COUNT(DISTINCT industry) as unique_industries
-            FROM stocks
-        """)
-        stats = cursor.fetchone()
-        
-        # Get top sectors
-        cursor.execute("""
-            SELECT 
-                sector,
-                COUNT(*) as count
-            FROM stocks 
-            WHERE sector IS NOT NULL AND sector != ''
-            GROUP BY sector 
-            ORDER BY count DESC 
-            LIMIT 10
-        """)
-        top_sectors = cursor.fetchall()
-        
-        cursor.close()
-        conn.close()
-        
-        return jsonify({
-            'success': True,
-            'data': {
-                'overall': dict(stats),
-                'top_sectors': top_sectors
-            }
-        })
+        return cached_json_response('stats', STATS_CACHE_TTL, _fetch_stats, raw=True)
         
     except Exception as e:
         logger.error(f"Error fetching stats: {e}")
@@ -241,7 +770,13 @@ def get_stats():
 def search_companies():
     """Search companies by name or symbol"""
     query = request.args.get('q', '').strip()
-    limit = int(request.args.get('limit', 20))
+    try:
+        limit = min(max(int(request.args.get('limit', 20)), 1), MAX_SEARCH_LIMIT)
+    except ValueError:
+        return jsonify({
+            'success': False,
+            'error': 'limit must be an integer'
+        }), 400
     
     if not query or len(query) < 2:
         return jsonify({
@@ -250,37 +785,16 @@ def search_companies():
         }), 400
     
     try:
-        conn = stock_api.get_db_connection()
-        cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-        
-        cursor.execute("""
-            SELECT 
-                symbol,
-                company_name,
-                sector,
-                industry,
-                market_cap
-            FROM stocks 
-            WHERE 
-                symbol ILIKE %s 
-                OR company_name ILIKE %s
-            ORDER BY 
-                CASE 
-                    WHEN symbol ILIKE %s THEN 1
-                    WHEN company_name ILIKE %s THEN 2
-                    ELSE 3
-                END,
-                CASE WHEN company_name IS NOT NULL AND company_name != '' 
-                     THEN company_name 
-                     ELSE symbol 
-                END
-            LIMIT %s
-        """, (f'%{query}%', f'%{query}%', f'{query}%', f'{query}%', limit))
-        
-        results = cursor.fetchall()
-        
-        cursor.close()
-        conn.close()
+        with stock_api.cursor(dict_rows=False) as cursor:
+            stock_api.execute(
+                cursor, 'q_search',
+                (f'%{query}%', f'{query}%', limit, query)
+            )
+
+            results = [
+                {'symbol': r[0], 'company_name': r[1], 'sector': r[2], 'industry': r[3], 'market_cap': r[4]}
+                for r in cursor
+            ]
         
         return jsonify({
             'success': True,
@@ -307,34 +821,20 @@ def get_stock_history():
         }), 400
     
     try:
-        conn = stock_api.get_db_connection()
-        cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-        
-        # Query to get price history, ordered by time
-        cursor.execute("""
+        # Query to get price history, ordered by time; REAL closes keep the
+        # four-decimal string format they had as DECIMAL(12,4)
+        price_history = stream_rows(f"""
             SELECT 
-                time,
+                to_char(time, '{ISO_TIMESTAMP_FORMAT}') as time,
                 symbol,
-                close_price
+                close_price::text::numeric(12,4)::text as close_price
             FROM stock_prices 
             WHERE symbol = %s 
-            ORDER BY time DESC
+            ORDER BY stock_prices.time DESC
             LIMIT %s
         """, (symbol, days))
         
-        price_history = cursor.fetchall()
-        
-        # Convert datetime objects to string format for JSON serialization
-        for record in price_history:
-            record['time'] = record['time'].isoformat()
-        
-        cursor.close()
-        conn.close()
-        
-        return jsonify({
-            'success': True,
-            'data': price_history
-        })
+        return stream_json_response(price_history)
         
     except Exception as e:
         logger.error(f"Error fetching stock history for {symbol}: {e}")
@@ -349,10 +849,8 @@ def get_stock_history():
 def get_index_types():
     """Get all available index types - now only sector_industry"""
     try:
-        return jsonify({
-            'success': True,
-            'data': ['sector_industry']  # Only one type now
-        })
+        # Only one type now
+        return cached_json_response('index_types', INDEX_CACHE_TTL, lambda: ['sector_industry'])
     except Exception as e:
         logger.error(f"Error getting index types: {e}")
         return jsonify({
@@ -360,34 +858,25 @@ def get_index_types():
             'error': str(e)
         }), 500
 
-@app.route('/api/indices/names', methods=['GET'])
-def get_index_names():
-    """Get all available sector-industry index names"""
-    try:
-        generator = EquiweightedIndexGenerator()
-        
-        conn = stock_api.get_db_connection()
-        cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-        
+def _fetch_index_names():
+    """Query the generated sector-industry index names"""
+    with stock_api.cursor() as cursor:
         # Only get sector_industry indices
-        query = """
+        cursor.execute("""
             SELECT DISTINCT index_name, index_type, MAX(constituent_count) as constituent_count
             FROM equiweighted_indices
             WHERE index_type = 'sector_industry'
             GROUP BY index_name, index_type 
             ORDER BY index_name
-        """
-        
-        cursor.execute(query)
-        indices = cursor.fetchall()
-        
-        cursor.close()
-        conn.close()
+        """)
         
-        return jsonify({
-            'success': True,
-            'data': indices
-        })
+        return cursor.fetchall()
+
+@app.route('/api/indices/names', methods=['GET'])
+def get_index_names():
+    """Get all available sector-industry index names"""
+    try:
+        return cached_json_response('index_names', INDEX_CACHE_TTL, _fetch_index_names)
     
     except Exception as e:
         logger.error(f"Error getting index names: {e}")
@@ -400,8 +889,6 @@ def get_index_names():
 def get_index_data():
     """Get index data for plotting - only sector_industry type"""
     index_name = request.args.get('name')
-    start_date = request.args.get('start_date')
-    end_date = request.args.get('end_date')
     
     if not index_name:
         return jsonify({
@@ -410,47 +897,33 @@ def get_index_data():
         }), 400
     
     try:
-        generator = EquiweightedIndexGenerator()
-        
-        # Convert dates if provided
-        start_date_obj = None
-        if start_date:
-            start_date_obj = datetime.strptime(start_date, '%Y-%m-%d')
-        
-        end_date_obj = None
-        if end_date:
-            end_date_obj = datetime.strptime(end_date, '%Y-%m-%d')
-        
-        # Get the data (always sector_industry type)
-        df = generator.get_index_data(
-            index_name=index_name, 
+        start_date = _parse_day(request.args.get('start_date'))
+        end_date = _parse_day(request.args.get('end_date'))
+    except ValueError:
+        return jsonify({
+            'success': False,
+            'error': 'start_date and end_date must be YYYY-MM-DD dates'
+        }), 400
+    
+    try:
+        # Only sector_industry indices are served
+        query, params = EquiweightedIndexGenerator.index_data_query(
+            index_name=index_name,
             index_type='sector_industry',
-            start_date=start_date_obj,
-            end_date=end_date_obj
+            start_date=start_date,
+            end_date=end_date
         )
         
-        if df.empty:
+        rows = stream_rows(query, params, dec2float=True)
+        first = next(rows, None)
+        
+        if first is None:
             return jsonify({
                 'success': False,
                 'error': 'No data found for the specified index'
             }), 404
         
-        # Convert DataFrame to list of dictionaries
-        result = []
-        for _, row in df.iterrows():
-            item = {
-                'time': row['time'].isoformat() if hasattr(row['time'], 'isoformat') else str(row['time']),
-                'index_name': row['index_name'],
-                'index_type': row['index_type'],
-                'index_value': float(row['index_value']),
-                'constituent_count': int(row['constituent_count'])
-            }
-            result.append(item)
-        
-        return jsonify({
-            'success': True,
-            'data': result
-        })
+        return stream_json_response(itertools.chain([first], rows))
     
     except Exception as e:
         logger.error(f"Error getting index data: {e}")
@@ -466,30 +939,55 @@ def generate_indices():
         data = request.get_json()
         start_date = data.get('start_date')
         end_date = data.get('end_date')
+        # Drop the secondary indexes during generation and rebuild them afterwards
+        fast_reindex = bool(data.get('fast_reindex', False))
         
         # Convert dates if provided
-        start_date_obj = None
-        if start_date:
-            start_date_obj = datetime.strptime(start_date, '%Y-%m-%d')
-        
-        end_date_obj = None
-        if end_date:
-            end_date_obj = datetime.strptime(end_date, '%Y-%m-%d')
-        
-        # Create the generator
-        generator = EquiweightedIndexGenerator()
-        
-        # Create the table if it doesn't exist
-        generator.create_index_table()
+        try:
+            start_date_obj = _parse_day(start_date)
+            end_date_obj = _parse_day(end_date)
+        except (TypeError, ValueError):
+            return jsonify({
+                'success': False,
+                'error': 'start_date and end_date must be YYYY-MM-DD dates'
+            }), 400
         
-        # Start a background thread for generation
-        import threading
-        thread = threading.Thread(
-            target=generator.generate_all_indices,
-            args=(start_date_obj, end_date_obj)
-        )
-        thread.daemon = True
-        thread.start()
+        def run_generation():
+            try:
+                generator.generate_all_indices(start_date_obj, end_date_obj, fast_reindex=fast_reindex)
+                stock_api.invalidate('index_names', 'sector_industry_combinations')
+            except Exception as e:
+                logger.error(f"Error generating indices in the background: {e}")
+                raise
+            finally:
+                index_generation['finished_at'] = datetime.now()
+        
+        with index_generation_lock:
+            job = index_generation['job']
+            if job is not None and not job.done():
+                return jsonify({
+                    'success': False,
+                    'error': 'Index generation is already in progress'
+                }), 409
+            
+            generator = index_generator()
+            
+            # Table DDL runs once per process, not on every POST; a failure
+            # is reported instead of queuing a run against a missing table
+            if not index_generation['table_ready']:
+                if not generator.create_index_table():
+                    return jsonify({
+                        'success': False,
+                        'error': 'Failed to create the index table'
+                    }), 500
+                index_generation['table_ready'] = True
+            
+            # Queue the run on the background worker
+            index_generation.update(
+                job=index_generation_executor.submit(run_generation),
+                started_at=datetime.now(),
+                finished_at=None
+            )
         
         return jsonify({
             'success': True,
@@ -503,36 +1001,63 @@ def generate_indices():
             'error': str(e)
         }), 500
 
-@app.route('/api/indices/sector_industry_combinations', methods=['GET'])
-def get_sector_industry_combinations():
-    """Get all available sector-industry combinations with stock counts"""
+@app.route('/api/indices/generate/status', methods=['GET'])
+def get_index_generation_status():
+    """Report the state of the latest index generation run"""
     try:
-        conn = stock_api.get_db_connection()
-        cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+        with index_generation_lock:
+            job = index_generation['job']
+            started_at = index_generation['started_at']
+            finished_at = index_generation['finished_at']
+        
+        error = None
+        if job is None:
+            status = 'idle'
+        elif not job.done():
+            status = 'running'
+        elif job.exception() is not None:
+            status = 'failed'
+            error = str(job.exception())
+        else:
+            status = 'completed'
         
+        return jsonify({
+            'success': True,
+            'data': {
+                'status': status,
+                'started_at': started_at.isoformat() if started_at else None,
+                'finished_at': finished_at.isoformat() if finished_at else None,
+                'error': error
+            }
+        })
+    
+    except Exception as e:
+        logger.error(f"Error getting index generation status: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+def _fetch_sector_industry_combinations():
+    """Query sector-industry combinations large enough to have an index"""
+    with stock_api.cursor() as cursor:
+        # Precomputed by database.refresh_materialized_views
         cursor.execute("""
-            SELECT 
-                sector,
-                industry,
-                COUNT(*) as stock_count,
-                CONCAT('SECTOR-INDUSTRY-', sector, '-', industry) as index_name
-            FROM stocks 
-            WHERE sector IS NOT NULL AND sector != '' 
-              AND industry IS NOT NULL AND industry != '' 
-            GROUP BY sector, industry
-            HAVING COUNT(*) >= 3  -- Only combinations with at least 3 stocks
+            SELECT sector, industry, stock_count, index_name
+            FROM mv_sector_industry_combos
             ORDER BY sector, industry
         """)
         
-        combinations = cursor.fetchall()
-        
-        cursor.close()
-        conn.close()
-        
-        return jsonify({
-            'success': True,
-            'data': combinations
-        })
+        return cursor.fetchall()
+
+@app.route('/api/indices/sector_industry_combinations', methods=['GET'])
+def get_sector_industry_combinations():
+    """Get all available sector-industry combinations with stock counts"""
+    try:
+        return cached_json_response(
+            'sector_industry_combinations', LOOKUP_CACHE_TTL,
+            _fetch_sector_industry_combinations
+        )
         
     except Exception as e:
         logger.error(f"Error fetching sector-industry combinations: {e}")
@@ -556,49 +1081,19 @@ def get_stocks_by_sector_industry():
         }), 400
     
     try:
-        conn = stock_api.get_db_connection()
-        cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-        
-        cursor.execute("""
-            SELECT 
-                symbol,
-                company_name,
-                sector,
-                industry,
-                market_cap
-            FROM stocks 
-            WHERE sector = %s AND industry = %s
-            ORDER BY 
-                CASE WHEN market_cap IS NOT NULL THEN market_cap ELSE 0 END DESC,
-                CASE WHEN company_name IS NOT NULL AND company_name != '' 
-                     THEN company_name 
-                     ELSE symbol 
-                END
-        """, (sector, industry))
-        
-        stocks = cursor.fetchall()
-        
-        cursor.close()
-        conn.close()
-        
-        # Convert to regular dict for JSON serialization
-        stocks_list = []
-        for stock in stocks:
-            stocks_list.append({
-                'symbol': stock['symbol'],
-                'company_name': stock['company_name'],
-                'sector': stock['sector'],
-                'industry': stock['industry'],
-                'market_cap': stock['market_cap']
-            })
+        with stock_api.cursor() as cursor:
+            stock_api.execute(cursor, 'q_stocks_by_sector_industry', (sector, industry))
+
+            # RealDictRows serialize as-is, no per-row copy needed
+            stocks = cursor.fetchall()
         
         return jsonify({
             'success': True,
             'data': {
-                'stocks': stocks_list,
+                'stocks': stocks,
                 'sector': sector,
                 'industry': industry,
-                'total_stocks': len(stocks_list)
+                'total_stocks': len(stocks)
             }
         })
         
@@ -623,78 +1118,64 @@ def get_stock_stage_analysis():
         }), 400
     
     try:
-        conn = stock_api.get_db_connection()
-        cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-        
-        # Get stocks to analyze
-        if symbols:
-            symbol_list = [s.strip() for s in symbols.split(',')]
-            cursor.execute("""
-                SELECT symbol, company_name, sector, industry, market_cap
-                FROM stocks 
-                WHERE symbol = ANY(%s)
-                ORDER BY symbol
-            """, (symbol_list,))
-        else:
-            cursor.execute("""
-                SELECT symbol, company_name, sector, industry, market_cap
-                FROM stocks 
-                WHERE sector = %s AND industry = %s
-                ORDER BY symbol
-            """, (sector, industry))
-        
-        stocks = cursor.fetchall()
-        
-        if not stocks:
-            return jsonify({
-                'success': False,
-                'error': 'No stocks found for the specified criteria'
-            }), 404
+        with stock_api.cursor(dict_rows=False) as cursor:
+            # Get stocks to analyze
+            if symbols:
+                symbol_list = [s.strip() for s in symbols.split(',')]
+                stock_api.execute(cursor, 'q_stage_stocks_by_symbols', (symbol_list,))
+            else:
+                stock_api.execute(cursor, 'q_stage_stocks_by_sector_industry', (sector, industry))
+
+            columns = [column.name for column in cursor.description]
+            stocks = [dict(zip(columns, row)) for row in cursor]
+
+            if not stocks:
+                return jsonify({
+                    'success': False,
+                    'error': 'No stocks found for the specified criteria'
+                }), 404
+
+            # Get a year of price history for all stocks in one query
+            stock_api.execute(cursor, 'q_stage_prices', ([stock['symbol'] for stock in stocks],))
+
+            # (time, close_price) pairs per symbol
+            prices_by_symbol = {
+                symbol: [row[1:] for row in rows]
+                for symbol, rows in itertools.groupby(cursor, key=itemgetter(0))
+            }
         
         # Calculate stage analysis for each stock
         results = []
-        
+
         for stock in stocks:
             try:
-                # Get price history for the stock
-                cursor.execute("""
-                    SELECT time, close_price
-                    FROM stock_prices 
-                    WHERE symbol = %s 
-                      AND time >= NOW() - INTERVAL '1 year'
-                    ORDER BY time ASC
-                """, (stock['symbol'],))
-                
-                price_data = cursor.fetchall()
-                
+                price_data = prices_by_symbol.get(stock['symbol'], [])
+
                 if len(price_data) >= 30:  # Need at least 30 data points
                     stage_analysis = calculate_stock_stage_analysis(price_data, stock)
-                    stage_analysis['stock_info'] = dict(stock)
+                    stage_analysis['stock_info'] = stock
                     results.append(stage_analysis)
                 else:
                     # Not enough data for analysis
                     results.append({
-                        'stock_info': dict(stock),
+                        'stock_info': stock,
                         'stage': 0,
                         'stage_description': 'Insufficient Data',
                         'stage_details': f'Only {len(price_data)} data points available',
                         'error': 'Insufficient price history for analysis'
                     })
-                    
+
             except Exception as e:
                 logger.error(f"Error analyzing {stock['symbol']}: {e}")
                 results.append({
-                    'stock_info': dict(stock),
+                    'stock_info': stock,
                     'stage': 0,
                     'stage_description': 'Analysis Failed',
                     'stage_details': f'Error: {str(e)}',
                     'error': str(e)
                 })
         
-        cursor.close()
-        conn.close()
-        
-        return jsonify({
+        return iso_json_response({
             'success': True,
             'data': {
                 'stocks_analysis': results,
@@ -712,42 +1193,38 @@ def get_stock_stage_analysis():
         }), 500
 
 def calculate_stock_stage_analysis(price_data, stock_info):
-    """Calculate Weinstein stage analysis for individual stock"""
+    """Calculate Weinstein stage analysis for individual stock from (time, close_price) rows"""
     try:
-        # Convert price data to lists
-        dates = [row['time'] for row in price_data]
-        prices = [float(row['close_price']) for row in price_data]
+        # Convert price data to arrays
+        dates = [row[0] for row in price_data]
+        prices = np.fromiter((row[1] for row in price_data), dtype=np.float64, count=len(price_data))
         
         if len(prices) < 30:
             raise ValueError("Insufficient price data")
         
         # Calculate 30-period moving average
         ma_period = min(30, len(prices) // 3)
-        moving_average = []
-        
-        for i in range(ma_period - 1, len(prices)):
-            ma_value = sum(prices[i - ma_period + 1:i + 1]) / ma_period
-            moving_average.append(ma_value)
+        moving_average = sliding_window_view(prices, ma_period).mean(axis=1)
         
         # Get current values
-        current_price = prices[-1]
-        current_ma = moving_average[-1] if moving_average else prices[-1]
-        previous_ma = moving_average[-2] if len(moving_average) > 1 else current_ma
+        current_price = float(prices[-1])
+        current_ma = float(moving_average[-1]) if moving_average.size else current_price
+        previous_ma = float(moving_average[-2]) if moving_average.size > 1 else current_ma
         
         # Calculate trend characteristics
         price_vs_ma = 'above' if current_price > current_ma else 'below'
         ma_trend = 'rising' if current_ma > previous_ma else ('falling' if current_ma < previous_ma else 'flat')
         
         # Calculate recent performance and volatility
-        recent_20 = prices[-20:] if len(prices) >= 20 else prices
-        recent_high = max(recent_20)
-        recent_low = min(recent_20)
+        recent_20 = prices[-20:]
+        recent_high = float(recent_20.max())
+        recent_low = float(recent_20.min())
         volatility = (recent_high - recent_low) / recent_low if recent_low > 0 else 0
         
         # Calculate 20-day performance
         performance_20 = 0
         if len(prices) >= 20:
-            performance_20 = (current_price - prices[-20]) / prices[-20] * 100
+            performance_20 = float((current_price - prices[-20]) / prices[-20] * 100)
         
         # Calculate trend strength
         trend_strength = abs(performance_20)
@@ -784,8 +1261,8 @@ def calculate_stock_stage_analysis(price_data, stock_info):
             'volatility': round(volatility * 100, 2),
             'recent_high': round(recent_high, 2),
             'recent_low': round(recent_low, 2),
-            'price_data': [{'time': dates[i].isoformat(), 'price': prices[i]} for i in range(len(prices))],
-            'moving_average_data': moving_average
+            'price_data': [{'time': day, 'price': price} for day, price in zip(dates, prices.tolist())],
+            'moving_average_data': moving_average.tolist()
         }
         
     except Exception as e:
@@ -836,25 +1313,25 @@ def estimate_stock_stage_duration(prices, moving_average):
     recent_prices = prices[-recent_periods:]
     recent_ma = moving_average[-min(len(moving_average), recent_periods):]
     
-    stage_changes = 0
-    current_stage_periods = 0
-    
-    for i in range(1, min(len(recent_prices), len(recent_ma))):
-        prev_condition = recent_prices[i-1] > recent_ma[i-1]
-        curr_condition = recent_prices[i] > recent_ma[i]
-        
-        if prev_condition != curr_condition:
-            stage_changes += 1
-            current_stage_periods = 0
-        current_stage_periods += 1
+    # Periods since the price last crossed the moving average
+    periods = min(len(recent_prices), len(recent_ma))
+    above_ma = recent_prices[:periods] > recent_ma[:periods]
+    crossings = np.flatnonzero(above_ma[1:] != above_ma[:-1])
+    current_stage_periods = periods - crossings[-1] - 1 if crossings.size else periods - 1
     
-    return max(current_stage_periods, 1)
+    return max(int(current_stage_periods), 1)
 
 @app.route('/api/stocks/price_history_detailed', methods=['GET'])
 def get_stock_price_history_detailed():
     """Get detailed price history for a specific stock with stage analysis"""
     symbol = request.args.get('symbol')
-    days = int(request.args.get('days', 365))
+    try:
+        days = int(request.args.get('days', 365))
+    except ValueError:
+        return jsonify({
+            'success': False,
+            'error': 'days must be an integer'
+        }), 400
     
     if not symbol:
         return jsonify({
@@ -863,37 +1340,19 @@ def get_stock_price_history_detailed():
         }), 400
     
     try:
-        conn = stock_api.get_db_connection()
-        cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-        
-        # Get stock info
-        cursor.execute("""
-            SELECT symbol, company_name, sector, industry, market_cap
-            FROM stocks 
-            WHERE symbol = %s
-        """, (symbol,))
-        
-        stock_info = cursor.fetchone()
-        
-        if not stock_info:
+        with stock_api.cursor(dict_rows=False) as cursor:
+            stock_api.execute(cursor, 'q_price_history_detailed', (symbol, days))
+
+            rows = cursor.fetchall()
+
+        if not rows:
             return jsonify({
                 'success': False,
                 'error': 'Stock not found'
             }), 404
-        
-        # Get price history
-        cursor.execute("""
-            SELECT time, close_price
-            FROM stock_prices 
-            WHERE symbol = %s 
-              AND time >= NOW() - INTERVAL '%s days'
-            ORDER BY time ASC
-        """, (symbol, days))
-        
-        price_data = cursor.fetchall()
-        
-        cursor.close()
-        conn.close()
+
+        stock_info = dict(zip(('symbol', 'company_name', 'sector', 'industry', 'market_cap'), rows[0][:5]))
+        price_data = [row[5:] for row in rows if row[5] is not None]
         
         # Calculate stage analysis if enough data
         stage_analysis = None
@@ -903,19 +1362,14 @@ def get_stock_price_history_detailed():
             except Exception as e:
                 logger.error(f"Error calculating stage analysis for {symbol}: {e}")
         
-        # Format price data for response
-        formatted_price_data = []
-        for record in price_data:
-            formatted_price_data.append({
-                'time': record['time'].isoformat(),
-                'close_price': float(record['close_price'])
-            })
-        
-        return jsonify({
+        return iso_json_response({
             'success': True,
             'data': {
-                'stock_info': dict(stock_info),
-                'price_history': formatted_price_data,
+                'stock_info': stock_info,
+                'price_history': [
+                    {'time': day, 'close_price': close_price}
+                    for day, close_price in price_data
+                ],
                 'stage_analysis': stage_analysis,
                 'data_points': len(price_data)
             }
@@ -929,4 +1383,6 @@ def get_stock_price_history_detailed():
         }), 500
 
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
+    # Development server only; production runs wsgi:app under gunicorn
+    start_materialized_view_refresh()
+    app.run(debug=stock_api.config.API_DEBUG, threaded=True, host='0.0.0.0', port=5000)
\ No newline at end of file
@@ -11,12 +11,25 @@ class Config:
     DB_NAME = os.getenv('DB_NAME', 'indian_stocks')
     DB_USER = os.getenv('DB_USER', 'postgres')
     DB_PASSWORD = os.getenv('DB_PASSWORD')
+    DB_POOL_MIN = int(os.getenv('DB_POOL_MIN', 5))
+    DB_POOL_MAX = int(os.getenv('DB_POOL_MAX', 25))
+    DB_POOL_TIMEOUT = int(os.getenv('DB_POOL_TIMEOUT', 10))
+    # Disable behind pgbouncer in transaction pooling mode, where a session's
+    # prepared statements are not guaranteed to exist on the next transaction
+    DB_PREPARE_STATEMENTS = os.getenv('DB_PREPARE_STATEMENTS', 'true').lower() in ('true', '1', 'yes', 'on')
     
     # Application settings
     BATCH_SIZE = int(os.getenv('BATCH_SIZE', 50))
     HISTORY_DAYS = int(os.getenv('HISTORY_DAYS', 365))
+    # Age in days at which hypertable chunks are compressed; kept past the
+    # HISTORY_DAYS backfill and index regeneration window so their upserts
+    # never have to rewrite compressed chunks
+    COMPRESS_AFTER_DAYS = int(os.getenv('COMPRESS_AFTER_DAYS', HISTORY_DAYS + 30))
     UPDATE_INTERVAL_HOURS = int(os.getenv('UPDATE_INTERVAL_HOURS', 1))
     LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+    API_DEBUG = os.getenv('API_DEBUG', 'false').lower() in ('true', '1', 'yes', 'on')
+    # Seconds between background refreshes of the API's materialized views (0 disables)
+    MV_REFRESH_INTERVAL = int(os.getenv('MV_REFRESH_INTERVAL', 300))
     
     # Yahoo Finance settings
     MAX_RETRIES = int(os.getenv('MAX_RETRIES', 3))
@@ -1,28 +1,105 @@
 import psycopg2
 import psycopg2.extras
 from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+from psycopg2.pool import ThreadedConnectionPool
+from cachetools import TTLCache
+import csv
+import io
 import logging
+import threading
+from contextlib import contextmanager
 from typing import List, Dict, Optional
 from datetime import datetime
 from config import Config
 
 logger = logging.getLogger(__name__)
 
+# Connections shared by all TimescaleDBManager instances in the process, so
+# connect()/close() cycles reuse sessions instead of reconnecting each time.
+# Capped at DB_POOL_MIN, since API workers also hold StockAPI's own pool
+_connection_pool = None
+_connection_pool_lock = threading.Lock()
+# One slot per pooled connection; connect() waits on a slot instead of
+# failing with "connection pool exhausted"
+_connection_slots = None
+
+def get_connection_pool(config: Config) -> ThreadedConnectionPool:
+    """Get the process-wide connection pool, creating it on first use"""
+    global _connection_pool, _connection_slots
+    if _connection_pool is None:
+        with _connection_pool_lock:
+            if _connection_pool is None:
+                _connection_slots = threading.BoundedSemaphore(config.DB_POOL_MIN)
+                _connection_pool = ThreadedConnectionPool(
+                    1,
+                    config.DB_POOL_MIN,
+                    host=config.DB_HOST,
+                    port=config.DB_PORT,
+                    database=config.DB_NAME,
+                    user=config.DB_USER,
+                    password=config.DB_PASSWORD
+                )
+    return _connection_pool
+
+# Symbol list cached per process; insert_stocks and invalidate_stock_symbols()
+# drop it early, the TTL bounds staleness from writes in other processes
+STOCK_SYMBOLS_CACHE_TTL = 300
+_stock_symbols_cache = TTLCache(maxsize=1, ttl=STOCK_SYMBOLS_CACHE_TTL)
+_stock_symbols_cache_lock = threading.Lock()
+
+def invalidate_stock_symbols():
+    """Forget the cached symbol list after the stocks table changes"""
+    with _stock_symbols_cache_lock:
+        _stock_symbols_cache.clear()
+
+def enable_compression(cursor, table: str, segmentby: str, compress_after_days: int):
+    """
+    Turn on native compression for a hypertable and compress chunks older than
+    compress_after_days, one segment per segmentby value.
+    
+    Needs TimescaleDB 2.x. Upserts that do reach compressed chunks (e.g. a
+    backfill older than compress_after_days) need 2.11+, which decompresses
+    the affected segments; older versions reject them.
+    """
+    cursor.execute("""
+        SELECT compression_enabled 
+        FROM timescaledb_information.hypertables 
+        WHERE hypertable_name = %s;
+    """, (table,))
+    if not cursor.fetchone()[0]:
+        cursor.execute(f"""
+            ALTER TABLE {table} SET (
+                timescaledb.compress,
+                timescaledb.compress_segmentby = '{segmentby}',
+                timescaledb.compress_orderby = 'time DESC'
+            );
+        """)
+    
+    # Re-created on every run so a changed compress_after reaches existing tables
+    cursor.execute("SELECT remove_compression_policy(%s, if_exists => TRUE);", (table,))
+    cursor.execute("""
+        SELECT add_compression_policy(%s, make_interval(days => %s));
+    """, (table, compress_after_days))
+
 class TimescaleDBManager:
     def __init__(self):
         self.config = Config()
         self.connection = None
+        self.bulk_mode_enabled = False
         
     def connect(self):
-        """Connect to TimescaleDB"""
+        """Connect to TimescaleDB (borrows a connection from the shared pool)"""
         try:
-            self.connection = psycopg2.connect(
-                host=self.config.DB_HOST,
-                port=self.config.DB_PORT,
-                database=self.config.DB_NAME,
-                user=self.config.DB_USER,
-                password=self.config.DB_PASSWORD
-            )
+            self.close()
+            pool = get_connection_pool(self.config)
+            if not _connection_slots.acquire(timeout=self.config.DB_POOL_TIMEOUT):
+                logger.error("Timed out waiting for a database connection")
+                return False
+            try:
+                self.connection = pool.getconn()
+            except Exception:
+                _connection_slots.release()
+                raise
             logger.info("Connected to TimescaleDB successfully")
             return True
         except psycopg2.Error as e:
@@ -93,33 +170,123 @@ class TimescaleDBManager:
                     CREATE TABLE IF NOT EXISTS stock_prices (
                         time TIMESTAMPTZ NOT NULL,
                         symbol VARCHAR(20) NOT NULL,
-                        close_price DECIMAL(12,4) NOT NULL,
+                        close_price REAL NOT NULL,
                         created_at TIMESTAMPTZ DEFAULT NOW(),
                         PRIMARY KEY (time, symbol)
                     );
                 """)
                 
-                # Create hypertable
+                # Create hypertable; daily closes fill a month-long chunk with
+                # roughly 20 rows per symbol, far fewer chunks than 1-day ones
                 cursor.execute("""
                     SELECT create_hypertable('stock_prices', 'time', 
-                                            chunk_time_interval => INTERVAL '1 day',
+                                            chunk_time_interval => INTERVAL '1 month',
                                             if_not_exists => TRUE);
                 """)
                 
+                # Existing hypertables use the new interval for chunks created from now on
+                cursor.execute("""
+                    SELECT set_chunk_time_interval('stock_prices', INTERVAL '1 month');
+                """)
+                
+                # Closes are stored as 4-byte REAL; convert tables created with
+                # DECIMAL(12,4). Column types cannot change while compression is
+                # enabled, so it is undone here and re-enabled just below
+                cursor.execute("""
+                    SELECT data_type 
+                    FROM information_schema.columns 
+                    WHERE table_schema = current_schema() 
+                      AND table_name = 'stock_prices' AND column_name = 'close_price';
+                """)
+                if cursor.fetchone()[0] != 'real':
+                    cursor.execute("""
+                        SELECT compression_enabled 
+                        FROM timescaledb_information.hypertables 
+                        WHERE hypertable_name = 'stock_prices';
+                    """)
+                    if cursor.fetchone()[0]:
+                        cursor.execute("SELECT remove_compression_policy('stock_prices', if_exists => TRUE);")
+                        cursor.execute("""
+                            SELECT decompress_chunk(chunk, if_compressed => TRUE) 
+                            FROM show_chunks('stock_prices') chunk;
+                        """)
+                        cursor.execute("ALTER TABLE stock_prices SET (timescaledb.compress = false);")
+                    
+                    cursor.execute("""
+                        ALTER TABLE stock_prices 
+                        ALTER COLUMN close_price TYPE REAL USING close_price::real;
+                    """)
+                    logger.info("Converted stock_prices.close_price to REAL")
+                
+                # Compress chunks once they are older than the HISTORY_DAYS
+                # window load_historical_data and the daily updates upsert into
+                enable_compression(cursor, 'stock_prices', 'symbol', self.config.COMPRESS_AFTER_DAYS)
+                
                 # Create indexes for better performance
                 cursor.execute("""
                     CREATE INDEX IF NOT EXISTS idx_stocks_sector 
-                    ON stocks (sector);
+                    ON stocks (sector)
+                    WHERE sector IS NOT NULL AND sector != '';
                 """)
                 
                 cursor.execute("""
                     CREATE INDEX IF NOT EXISTS idx_stocks_industry 
-                    ON stocks (industry);
+                    ON stocks (industry)
+                    WHERE industry IS NOT NULL AND industry != '';
                 """)
                 
+                # Display name used for ordering: company name, falling back to the symbol
                 cursor.execute("""
-                    CREATE INDEX IF NOT EXISTS idx_stock_prices_symbol_time 
-                    ON stock_prices (symbol, time DESC);
+                    ALTER TABLE stocks ADD COLUMN IF NOT EXISTS sort_name VARCHAR(255)
+                    GENERATED ALWAYS AS (COALESCE(NULLIF(company_name, ''), symbol)) STORED;
+                """)
+                
+                cursor.execute("""
+                    CREATE INDEX IF NOT EXISTS idx_stocks_sort_name 
+                    ON stocks (sort_name, symbol);
+                """)
+                
+                # Covers the sector/industry filtered company listings in display order
+                cursor.execute("DROP INDEX IF EXISTS idx_stocks_sector_industry_name;")
+                
+                cursor.execute("""
+                    CREATE INDEX IF NOT EXISTS idx_stocks_filter_sort 
+                    ON stocks (sector, industry, sort_name, symbol);
+                """)
+                
+                # Trigram indexes let the substring (ILIKE '%q%') search use an index
+                cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm;")
+                
+                cursor.execute("""
+                    CREATE INDEX IF NOT EXISTS idx_stocks_symbol_trgm 
+                    ON stocks USING gin (symbol gin_trgm_ops);
+                """)
+                
+                cursor.execute("""
+                    CREATE INDEX IF NOT EXISTS idx_stocks_name_trgm 
+                    ON stocks USING gin (company_name gin_trgm_ops);
+                """)
+                
+                # Word-level search vector: symbol ranks above company name
+                cursor.execute("""
+                    ALTER TABLE stocks ADD COLUMN IF NOT EXISTS search_tsv tsvector
+                    GENERATED ALWAYS AS (
+                        setweight(to_tsvector('simple', symbol), 'A') ||
+                        setweight(to_tsvector('simple', coalesce(company_name, '')), 'B')
+                    ) STORED;
+                """)
+                
+                cursor.execute("""
+                    CREATE INDEX IF NOT EXISTS idx_stocks_search_tsv 
+                    ON stocks USING gin (search_tsv);
+                """)
+                
+                # Covers per-symbol price reads so they can be answered from the index alone
+                cursor.execute("DROP INDEX IF EXISTS idx_stock_prices_symbol_time;")
+                
+                cursor.execute("""
+                    CREATE INDEX IF NOT EXISTS idx_stock_prices_symbol_time_close 
+                    ON stock_prices (symbol, time DESC) INCLUDE (close_price);
                 """)
                 
                 cursor.execute("""
@@ -127,6 +294,63 @@ class TimescaleDBManager:
                     ON stock_prices (time DESC);
                 """)
                 
+                # Precomputed stats for the API; refreshed after stock ingestion
+                cursor.execute("""
+                    CREATE MATERIALIZED VIEW IF NOT EXISTS mv_stock_stats AS
+                    SELECT 
+                        COUNT(*) as total_stocks,
+                        COUNT(*) FILTER (WHERE sector IS NOT NULL AND sector != '') as stocks_with_sector,
+                        COUNT(DISTINCT sector) as unique_sectors,
+                        COUNT(DISTINCT industry) as unique_industries
+                    FROM stocks;
+                """)
+                
+                cursor.execute("""
+                    CREATE UNIQUE INDEX IF NOT EXISTS idx_mv_stock_stats 
+                    ON mv_stock_stats (total_stocks);
+                """)
+                
+                cursor.execute("""
+                    CREATE MATERIALIZED VIEW IF NOT EXISTS mv_top_sectors AS
+                    SELECT sector, COUNT(*) as count
+                    FROM stocks 
+                    WHERE sector IS NOT NULL AND sector != ''
+                    GROUP BY sector;
+                """)
+                
+                cursor.execute("""
+                    CREATE UNIQUE INDEX IF NOT EXISTS idx_mv_top_sectors 
+                    ON mv_top_sectors (sector);
+                """)
+                
+                # Sector-industry combinations large enough to get an index
+                cursor.execute("""
+                    CREATE MATERIALIZED VIEW IF NOT EXISTS mv_sector_industry_combos AS
+                    SELECT 
+                        sector,
+                        industry,
+                        COUNT(*) as stock_count,
+                        CONCAT('SECTOR-INDUSTRY-', sector, '-', industry) as index_name
+                    FROM stocks 
+                    WHERE sector IS NOT NULL AND sector != '' 
+                      AND industry IS NOT NULL AND industry != '' 
+                    GROUP BY sector, industry
+                    HAVING COUNT(*) >= 3;
+                """)
+                
+                cursor.execute("""
+                    CREATE UNIQUE INDEX IF NOT EXISTS idx_mv_sector_industry_combos 
+                    ON mv_sector_industry_combos (sector, industry);
+                """)
+                
+                # Single row holding when the views above were last refreshed
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS mv_refresh_state (
+                        id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+                        refreshed_at TIMESTAMPTZ NOT NULL
+                    );
+                """)
+                
                 self.connection.commit()
                 logger.info("Database schema initialized successfully")
                 return True
@@ -136,27 +360,66 @@ class TimescaleDBManager:
             self.connection.rollback()
             return False
     
+    @contextmanager
+    def bulk_mode(self):
+        """
+        Relax commit durability for bulk inserts made inside the block
+        
+        A crash can lose the last few commits, which a bulk load simply reruns.
+        The setting is applied with SET LOCAL per insert transaction, so the
+        pooled connection goes back to other users fully durable.
+        """
+        previous, self.bulk_mode_enabled = self.bulk_mode_enabled, True
+        try:
+            yield self
+        finally:
+            self.bulk_mode_enabled = previous
+    
+    def _apply_bulk_mode(self, cursor):
+        """Skip waiting for the WAL flush on commit when in bulk mode"""
+        if self.bulk_mode_enabled:
+            cursor.execute("SET LOCAL synchronous_commit = off")
+    
     def insert_stocks(self, stocks: List[Dict]):
         """Insert stock metadata"""
         if not self.connection:
             return False
             
         try:
+            # One row per symbol (the last one wins), since a single upsert
+            # statement cannot update the same row twice
+            rows = {
+                stock['symbol']: (
+                    stock['symbol'],
+                    stock.get('company_name'),
+                    stock.get('sector'),
+                    stock.get('industry'),
+                    stock.get('market_cap')
+                )
+                for stock in stocks
+            }
+            
             with self.connection.cursor() as cursor:
-                for stock in stocks:
-                    cursor.execute("""
-                        INSERT INTO stocks (symbol, company_name, sector, industry, market_cap)
-                        VALUES (%(symbol)s, %(company_name)s, %(sector)s, %(industry)s, %(market_cap)s)
-                        ON CONFLICT (symbol) 
-                        DO UPDATE SET 
-                            company_name = EXCLUDED.company_name,
-                            sector = EXCLUDED.sector,
-                            industry = EXCLUDED.industry,
-                            market_cap = EXCLUDED.market_cap,
-                            updated_at = NOW()
-                    """, stock)
+                self._apply_bulk_mode(cursor)
+                psycopg2.extras.execute_values(
+                    cursor,
+                    """
+                    INSERT INTO stocks (symbol, company_name, sector, industry, market_cap)
+                    VALUES %s
+                    ON CONFLICT (symbol) 
+                    DO UPDATE SET 
+                        company_name = EXCLUDED.company_name,
+                        sector = EXCLUDED.sector,
+                        industry = EXCLUDED.industry,
+                        market_cap = EXCLUDED.market_cap,
+                        updated_at = NOW()
+                    """,
+                    list(rows.values()),
+                    page_size=1000
+                )
                 
                 self.connection.commit()
+                invalidate_stock_symbols()
                 logger.info(f"Inserted/updated {len(stocks)} stocks")
                 return True
                 
@@ -166,32 +429,44 @@ class TimescaleDBManager:
             return False
     
     def insert_stock_prices(self, prices: List[Dict]):
-        """Insert stock price data"""
+        """
+        Insert stock price data
+        
+        Rows are COPYed into a temporary staging table and upserted from there
+        in one statement, since COPY cannot resolve conflicts itself.
+        """
         if not self.connection:
             return False
             
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for price in prices:
+            writer.writerow((price['time'], price['symbol'], float(price['close_price'])))
+        buffer.seek(0)
+        
         try:
             with self.connection.cursor() as cursor:
-                # Use execute_values for better performance
-                psycopg2.extras.execute_values(
-                    cursor,
-                    """
+                self._apply_bulk_mode(cursor)
+                cursor.execute("""
+                    CREATE TEMP TABLE IF NOT EXISTS stock_prices_staging 
+                    (time TIMESTAMPTZ, symbol VARCHAR(20), close_price REAL) 
+                    ON COMMIT DELETE ROWS;
+                """)
+                
+                cursor.copy_expert("""
+                    COPY stock_prices_staging (time, symbol, close_price) 
+                    FROM STDIN WITH (FORMAT csv)
+                """, buffer)
+                
+                cursor.execute("""
                     INSERT INTO stock_prices 
                     (time, symbol, close_price)
-                    VALUES %s
+                    SELECT DISTINCT ON (time, symbol) time, symbol, close_price
+                    FROM stock_prices_staging
                     ON CONFLICT (time, symbol) 
                     DO UPDATE SET 
                         close_price = EXCLUDED.close_price
-                    """,
-                    [
-                        (
-                            price['time'],
-                            price['symbol'],
-                            price['close_price']
-                        )
-                        for price in prices
-                    ]
-                )
+                """)
                 
                 self.connection.commit()
                 logger.info(f"Inserted/updated {len(prices)} price records")
@@ -202,40 +477,116 @@ class TimescaleDBManager:
             self.connection.rollback()
             return False
     
+    def refresh_materialized_views(self, min_interval=None):
+        """
+        Refresh the materialized views derived from the stocks table
+        
+        With min_interval (seconds), return False without refreshing if any
+        session refreshed them less than min_interval ago or is refreshing them
+        now, so periodic refreshes from several API workers run once per interval.
+        """
+        if not self.connection:
+            return False
+            
+        try:
+            with self.connection.cursor() as cursor:
+                if min_interval is not None:
+                    cursor.execute("SELECT pg_try_advisory_xact_lock(hashtext('refresh_materialized_views'));")
+                    if not cursor.fetchone()[0]:
+                        self.connection.rollback()
+                        logger.info("Materialized views are being refreshed by another session")
+                        return False
+                    
+                    cursor.execute("""
+                        SELECT refreshed_at > NOW() - make_interval(secs => %s) 
+                        FROM mv_refresh_state;
+                    """, (min_interval,))
+                    row = cursor.fetchone()
+                    if row and row[0]:
+                        self.connection.rollback()
+                        logger.info("Materialized views were refreshed recently")
+                        return False
+                
+                cursor.execute("REFRESH MATERIALIZED VIEW CONCURRENTLY mv_stock_stats;")
+                cursor.execute("REFRESH MATERIALIZED VIEW CONCURRENTLY mv_top_sectors;")
+                cursor.execute("REFRESH MATERIALIZED VIEW CONCURRENTLY mv_sector_industry_combos;")
+                cursor.execute("""
+                    INSERT INTO mv_refresh_state (refreshed_at) VALUES (NOW())
+                    ON CONFLICT (id) DO UPDATE SET refreshed_at = EXCLUDED.refreshed_at;
+                """)
+                
+                self.connection.commit()
+                logger.info("Refreshed materialized views")
+                return True
+                
+        except psycopg2.Error as e:
+            logger.error(f"Error refreshing materialized views: {e}")
+            self.connection.rollback()
+            return False
+    
     def get_latest_price_date(self, symbol: str) -> Optional[datetime]:
         """Get the latest price date for a symbol"""
-        if not self.connection:
-            return None
+        return self.get_latest_price_dates([symbol]).get(symbol)
+    
+    def get_latest_price_dates(self, symbols: List[str]) -> Dict[str, datetime]:
+        """Get the latest price date for each symbol in one query (symbols without prices are omitted)"""
+        if not self.connection or not symbols:
+            return {}
             
         try:
             with self.connection.cursor() as cursor:
                 cursor.execute(
-                    "SELECT MAX(time) FROM stock_prices WHERE symbol = %s",
-                    (symbol,)
+                    """
+                    SELECT symbol, MAX(time)
+                    FROM stock_prices
+                    WHERE symbol = ANY(%s)
+                    GROUP BY symbol
+                    """,
+                    (list(symbols),)
                 )
-                result = cursor.fetchone()
-                return result[0] if result[0] else None
+                return dict(cursor.fetchall())
                 
         except psycopg2.Error as e:
-            logger.error(f"Error getting latest price date: {e}")
-            return None
+            logger.error(f"Error getting latest price dates: {e}")
+            self.connection.rollback()
+            return {}
     
     def get_stock_symbols(self) -> List[str]:
         """Get all stock symbols from database"""
         if not self.connection:
             return []
             
+        with _stock_symbols_cache_lock:
+            symbols = _stock_symbols_cache.get('symbols')
+        if symbols is not None:
+            return list(symbols)
+        
         try:
             with self.connection.cursor() as cursor:
                 cursor.execute("SELECT symbol FROM stocks ORDER BY symbol")
-                return [row[0] for row in cursor.fetchall()]
+                symbols = tuple(row[0] for row in cursor.fetchall())
+            
+            with _stock_symbols_cache_lock:
+                _stock_symbols_cache['symbols'] = symbols
+            return list(symbols)
                 
         except psycopg2.Error as e:
             logger.error(f"Error getting stock symbols: {e}")
             return []
     
     def close(self):
-        """Close database connection"""
+        """Close database connection (returns it to the shared pool)"""
         if self.connection:
-            self.connection.close()
+            connection, self.connection = self.connection, None
+            broken = bool(connection.closed)
+            if not broken:
+                try:
+                    # Discard any uncommitted work, as closing the connection would
+                    connection.rollback()
+                except psycopg2.Error:
+                    broken = True
+            try:
+                get_connection_pool(self.config).putconn(connection, close=broken)
+            finally:
+                _connection_slots.release()
             logger.info("Database connection closed")
\ No newline at end of file
@@ -1,11 +1,14 @@
 import requests
 import pandas as pd
 import logging
-import time
 import json
+import hashlib
+import os
+import re
 from typing import List, Dict, Optional
-from datetime import datetime
+from datetime import datetime, timedelta
 import io
+from concurrent.futures import ThreadPoolExecutor
 
 logger = logging.getLogger(__name__)
 
@@ -14,7 +17,27 @@ class DynamicNSEFetcher:
     Dynamic NSE Symbol Fetcher that gets real-time stock lists from multiple sources
     """
     
-    def __init__(self):
+    # Symbols containing any of these (anywhere, case-insensitively) are indices
+    INDEX_KEYWORDS = [
+        'NIFTY', 'SENSEX', 'BSE', 'INDEX', 'CNX', 'BANK', 'IT', 'AUTO', 
+        'PHARMA', 'METAL', 'ENERGY', 'FMCG', 'REALTY', 'MEDIA', 'PSU',
+        'MIDCAP', 'SMALLCAP', 'INFRASTRUCTURE', 'DIVIDEND', 'QUALITY',
+        'MOMENTUM', 'ALPHA', 'COMMODITIES', 'CONSUMPTION', 'CPSE'
+    ]
+    INDEX_SYMBOL_PATTERN = re.compile('|'.join(map(re.escape, INDEX_KEYWORDS)), re.IGNORECASE)
+    
+    STOCK_COLUMNS = ['symbol', 'company_name', 'sector', 'industry', 'market_cap']
+    
+    # Concurrent Yahoo Finance requests when testing symbol validity
+    VALIDITY_CHECK_WORKERS = 10
+    
+    # Daily equity Bhavcopy; files exist only for trading days
+    BHAVCOPY_URL = 'https://archives.nseindia.com/products/content/sec_bhavdata_full_{date:%d%m%Y}.csv'
+    BHAVCOPY_LOOKBACK_DAYS = 10
+    
+    def __init__(self, cache_dir: str = "cache/nifty"):
+        # Index lists are cached here and revalidated with conditional GETs
+        self.cache_dir = cache_dir
         self.headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
             'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
@@ -26,6 +49,9 @@ class DynamicNSEFetcher:
         }
         self.session = requests.Session()
         self.session.headers.update(self.headers)
+        # Sources and index lists are fetched concurrently over this session
+        adapter = requests.adapters.HTTPAdapter(pool_connections=8, pool_maxsize=16)
+        self.session.mount('https://', adapter)
         
         # Initialize session with NSE homepage to get cookies
         try:
@@ -46,14 +72,16 @@ class DynamicNSEFetcher:
             
             symbols = []
             for symbol, company_name in stock_codes.items():
-                # Only include individual stocks, not indices
-                if not self._is_index_symbol(symbol):
-                    symbols.append({
-                        'symbol': symbol + '.NS',
-                        'company_name': company_name,
-                        'sector': '',
-                        'market_cap': None
-                    })
+                symbol = str(symbol).strip()
+                # Only include individual stocks, not indices; reject before building the record
+                if not symbol or self._is_index_symbol(symbol):
+                    continue
+                symbols.append({
+                    'symbol': symbol + '.NS',
+                    'company_name': company_name,
+                    'sector': '',
+                    'market_cap': None
+                })
             
             logger.info(f"Fetched {len(symbols)} individual stock symbols using nsetools")
             return symbols
@@ -78,97 +106,124 @@ class DynamicNSEFetcher:
             'NIFTY SMALLCAP 100 Stocks': 'https://www1.nseindia.com/content/indices/ind_niftysmallcap100list.csv',
         }
         
-        for index_name, url in indices_urls.items():
-            try:
-                logger.info(f"Fetching individual stocks from {index_name}")
-                response = self.session.get(url, timeout=15)
-                
-                if response.status_code == 200:
-                    df = pd.read_csv(io.StringIO(response.text))
-                    
-                    # Clean column names (remove spaces and make consistent)
-                    df.columns = df.columns.str.strip()
-                    
-                    # Find symbol column (different indices might have different column names)
-                    symbol_col = None
-                    for col in df.columns:
-                        if 'symbol' in col.lower() or col.lower() in ['symbol', 'stock']:
-                            symbol_col = col
-                            break
-                    
-                    if symbol_col:
-                        for _, row in df.iterrows():
-                            symbol = str(row[symbol_col]).strip()
-                            # Only include individual stock symbols, not indices
-                            if symbol and symbol != 'nan' and not self._is_index_symbol(symbol):
-                                company_name = ''
-                                sector = ''
-                                
-                                # Try to get company name from different possible columns
-                                for col in df.columns:
-                                    if 'company' in col.lower() or 'name' in col.lower():
-                                        company_name = str(row[col]).strip()
-                                        break
-                                
-                                # Try to get sector information
-                                for col in df.columns:
-                                    if 'sector' in col.lower() or 'industry' in col.lower():
-                                        sector = str(row[col]).strip()
-                                        break
-                                
-                                symbols.append({
-                                    'symbol': symbol + '.NS',
-                                    'company_name': company_name,
-                                    'sector': sector,
-                                    'industry': '',
-                                    'market_cap': None
-                                })
-                        
-                        logger.info(f"Fetched {len(df)} individual stocks from {index_name}")
-                else:
-                    logger.warning(f"Failed to fetch {index_name}: HTTP {response.status_code}")
-                    
-            except Exception as e:
-                logger.warning(f"Error fetching {index_name}: {e}")
-                continue
-            
-            # Rate limiting
-            time.sleep(1)
-        
-        # Remove duplicates
-        unique_symbols = {}
-        for stock in symbols:
-            unique_symbols[stock['symbol']] = stock
+        # Index lists are independent, so fetch them concurrently
+        with ThreadPoolExecutor(max_workers=len(indices_urls)) as executor:
+            for index_symbols in executor.map(self._fetch_index_constituents, indices_urls.keys(), indices_urls.values()):
+                symbols.extend(index_symbols)
         
-        result = list(unique_symbols.values())
+        # Remove duplicates (the last listing of a symbol wins)
+        result = pd.DataFrame(symbols, columns=self.STOCK_COLUMNS).drop_duplicates('symbol', keep='last')
+        result = result.astype(object).where(result.notna(), None).to_dict('records')
         logger.info(f"Total unique individual stock symbols from indices: {len(result)}")
         return result
     
-    def _is_index_symbol(self, symbol: str) -> bool:
+    def _fetch_index_constituents(self, index_name: str, url: str) -> List[Dict]:
         """
-        Check if a symbol represents an index rather than an individual stock
+        Fetch the individual stocks listed in one Nifty index CSV
         """
-        index_keywords = [
-            'NIFTY', 'SENSEX', 'BSE', 'INDEX', 'CNX', 'BANK', 'IT', 'AUTO', 
-            'PHARMA', 'METAL', 'ENERGY', 'FMCG', 'REALTY', 'MEDIA', 'PSU',
-            'MIDCAP', 'SMALLCAP', 'INFRASTRUCTURE', 'DIVIDEND', 'QUALITY',
-            'MOMENTUM', 'ALPHA', 'COMMODITIES', 'CONSUMPTION', 'CPSE'
-        ]
+        symbols = []
         
-        symbol_upper = symbol.upper()
+        try:
+            logger.info(f"Fetching individual stocks from {index_name}")
+            status_code, content = self._get_with_disk_cache(url, timeout=15)
+            
+            if content is not None:
+                df = pd.read_csv(io.BytesIO(content))
+                
+                # Clean column names (remove spaces and make consistent)
+                df.columns = df.columns.str.strip()
+                
+                # Find symbol column (different indices might have different column names)
+                symbol_col = next(
+                    (col for col in df.columns if 'symbol' in col.lower() or col.lower() in ['symbol', 'stock']),
+                    None
+                )
+                # Company name and sector information columns, when present
+                name_col = next((col for col in df.columns if 'company' in col.lower() or 'name' in col.lower()), None)
+                sector_col = next((col for col in df.columns if 'sector' in col.lower() or 'industry' in col.lower()), None)
+                
+                if symbol_col:
+                    symbols = self._stock_records(df, symbol_col, name_col, sector_col)
+                    
+                    logger.info(f"Fetched {len(df)} individual stocks from {index_name}")
+            else:
+                logger.warning(f"Failed to fetch {index_name}: HTTP {status_code}")
+                
+        except Exception as e:
+            logger.warning(f"Error fetching {index_name}: {e}")
         
-        # Check if symbol contains index keywords
-        for keyword in index_keywords:
-            if keyword in symbol_upper:
-                return True
+        return symbols
+    
+    def _get_with_disk_cache(self, url: str, timeout: int):
+        """
+        GET a URL, revalidating a copy cached on disk with ETag/Last-Modified
         
-        # Additional checks for common index patterns
-        if (symbol_upper.startswith('CNX') or 
-            symbol_upper.startswith('NIFTY') or
-            'INDEX' in symbol_upper):
-            return True
-            
-        return False
+        Returns (status_code, body); body is None unless the server sent a
+        200, or a 304 for the cached copy.
+        """
+        key = hashlib.sha1(url.encode()).hexdigest()
+        body_path = os.path.join(self.cache_dir, f"{key}.csv")
+        meta_path = os.path.join(self.cache_dir, f"{key}.meta.json")
+        
+        headers = {}
+        if os.path.exists(body_path) and os.path.exists(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+            if meta.get('etag'):
+                headers['If-None-Match'] = meta['etag']
+            if meta.get('last_modified'):
+                headers['If-Modified-Since'] = meta['last_modified']
+        
+        response = self.session.get(url, headers=headers, timeout=timeout)
+        
+        if response.status_code == 304 and headers:
+            with open(body_path, 'rb') as f:
+                return response.status_code, f.read()
+        
+        if response.status_code != 200:
+            return response.status_code, None
+        
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(body_path, 'wb') as f:
+                f.write(response.content)
+            with open(meta_path, 'w') as f:
+                json.dump({
+                    'url': url,
+                    'etag': response.headers.get('ETag'),
+                    'last_modified': response.headers.get('Last-Modified')
+                }, f)
+        except OSError as e:
+            logger.warning(f"Could not cache {url}: {e}")
+        
+        return response.status_code, response.content
+    
+    def _stock_records(self, df: pd.DataFrame, symbol_col: str, name_col: Optional[str] = None,
+                       sector_col: Optional[str] = None) -> List[Dict]:
+        """
+        Build stock dicts from a listing DataFrame, skipping blank and index symbols
+        """
+        symbols = df[symbol_col].fillna('').astype(str).str.strip()
+        # Only include individual stock symbols, not indices
+        keep = symbols.ne('') & symbols.ne('nan') & ~symbols.str.contains(self.INDEX_SYMBOL_PATTERN)
+        
+        def text_column(col):
+            return df.loc[keep, col].fillna('').astype(str).str.strip() if col else ''
+        
+        return pd.DataFrame({
+            'symbol': symbols[keep] + '.NS',
+            'company_name': text_column(name_col),
+            'sector': text_column(sector_col),
+            'industry': '',
+            'market_cap': None
+        }).to_dict('records')
+    
+    def _is_index_symbol(self, symbol: str) -> bool:
+        """
+        Check if a symbol represents an index rather than an individual stock.
+        The pattern is case-insensitive, so the symbol is matched as given.
+        """
+        return bool(self.INDEX_SYMBOL_PATTERN.search(symbol))
     
     def fetch_from_nse_api(self) -> List[Dict]:
         """
@@ -190,17 +245,19 @@ class DynamicNSEFetcher:
             if response.status_code == 200:
                 data = response.json()
                 for stock in data:
-                    if isinstance(stock, dict) and 'symbol' in stock:
-                        symbol = stock['symbol']
-                        # Only include individual stocks, not indices
-                        if not self._is_index_symbol(symbol):
-                            symbols.append({
-                                'symbol': symbol + '.NS',
-                                'company_name': stock.get('companyName', ''),
-                                'sector': stock.get('industry', ''),
-                                'industry': '',
-                                'market_cap': None
-                            })
+                    if not isinstance(stock, dict) or 'symbol' not in stock:
+                        continue
+                    symbol = str(stock['symbol']).strip()
+                    # Only include individual stocks, not indices; reject before building the record
+                    if not symbol or self._is_index_symbol(symbol):
+                        continue
+                    symbols.append({
+                        'symbol': symbol + '.NS',
+                        'company_name': stock.get('companyName', ''),
+                        'sector': stock.get('industry', ''),
+                        'industry': '',
+                        'market_cap': None
+                    })
                 
                 logger.info(f"Fetched {len(symbols)} individual stock symbols from NSE API")
                 return symbols
@@ -220,41 +277,44 @@ class DynamicNSEFetcher:
             # NSE Bhavcopy URL (equity segment)
             logger.info("Fetching individual stocks from NSE Bhavcopy...")
             
-            # Try to get latest bhavcopy
-            from datetime import datetime, timedelta
+            # Weekdays in the lookback window, newest first
+            now = datetime.now()
+            candidates = [
+                day for day in (now - timedelta(days=days_back) for days_back in range(self.BHAVCOPY_LOOKBACK_DAYS))
+                if day.weekday() < 5
+            ]
+            urls = [self.BHAVCOPY_URL.format(date=day) for day in candidates]
             
-            # Try last few days to get a working bhavcopy
-            for days_back in range(0, 10):
-                date = datetime.now() - timedelta(days=days_back)
-                # Skip weekends
-                if date.weekday() >= 5:
-                    continue
-                
-                date_str = date.strftime('%d%m%Y')
-                bhavcopy_url = f'https://archives.nseindia.com/products/content/sec_bhavdata_full_{date_str}.csv'
-                
+            # Probe every candidate at once so holidays cost one round trip, not
+            # one timed-out download each; fall back to trying them all in order
+            # if the server answers no HEAD request with 200
+            with ThreadPoolExecutor(max_workers=len(urls)) as executor:
+                available = list(executor.map(self._bhavcopy_exists, urls))
+            if any(available):
+                candidates = [day for day, ok in zip(candidates, available) if ok]
+                urls = [url for url, ok in zip(urls, available) if ok]
+            
+            for date, bhavcopy_url in zip(candidates, urls):
                 try:
                     response = self.session.get(bhavcopy_url, timeout=20)
                     
                     if response.status_code == 200:
-                        df = pd.read_csv(io.StringIO(response.text))
+                        # Parse the raw bytes and materialize only the two columns we use;
+                        # headers and values in the full bhavdata carry leading spaces
+                        df = pd.read_csv(
+                            io.BytesIO(response.content),
+                            usecols=lambda column: column.strip() in ('SYMBOL', 'SERIES'),
+                            skipinitialspace=True
+                        )
+                        df.columns = df.columns.str.strip()
                         
                         # Filter for equity (EQ) series only - individual stocks
                         eq_stocks = df[df['SERIES'] == 'EQ'] if 'SERIES' in df.columns else df
                         
-                        for _, row in eq_stocks.iterrows():
-                            symbol = str(row['SYMBOL']).strip()
-                            # Only include individual stock symbols, not indices
-                            if symbol and symbol != 'nan' and not self._is_index_symbol(symbol):
-                                symbols.append({
-                                    'symbol': symbol + '.NS',
-                                    'company_name': '',  # Bhavcopy doesn't have company names
-                                    'sector': '',
-                                    'industry': '',
-                                    'market_cap': None
-                                })
+                        # Bhavcopy doesn't have company names
+                        symbols = self._stock_records(eq_stocks, 'SYMBOL')
                         
-                        logger.info(f"Fetched {len(symbols)} individual stock symbols from Bhavcopy dated {date_str}")
+                        logger.info(f"Fetched {len(symbols)} individual stock symbols from Bhavcopy dated {date:%d%m%Y}")
                         break
                         
                 except Exception as e:
@@ -265,6 +325,15 @@ class DynamicNSEFetcher:
         
         return symbols
     
+    def _bhavcopy_exists(self, url: str) -> bool:
+        """
+        Check with a HEAD request whether a Bhavcopy file has been published
+        """
+        try:
+            return self.session.head(url, timeout=10, allow_redirects=True).status_code == 200
+        except requests.RequestException:
+            return False
+    
     def fetch_from_external_apis(self) -> List[Dict]:
         """
         Fetch from external APIs that provide NSE data
@@ -310,62 +379,42 @@ class DynamicNSEFetcher:
         logger.info("Starting dynamic NSE stock fetch...")
         all_symbols = []
         
-        # Method 1: Use nsetools library (most reliable)
-        logger.info("=== Method 1: nsetools library ===")
-        nsetools_symbols = self.fetch_from_nsetools()
-        if nsetools_symbols:
-            all_symbols.extend(nsetools_symbols)
-            logger.info(f"✓ nsetools: {len(nsetools_symbols)} symbols")
-        else:
-            logger.warning("✗ nsetools: Failed")
-        
-        # Method 2: Fetch from Nifty indices (reliable for major stocks)
-        logger.info("=== Method 2: Nifty Indices ===")
-        indices_symbols = self.fetch_from_nifty_indices()
-        if indices_symbols:
-            all_symbols.extend(indices_symbols)
-            logger.info(f"✓ Nifty Indices: {len(indices_symbols)} symbols")
-        else:
-            logger.warning("✗ Nifty Indices: Failed")
-        
-        # Method 3: Try NSE API
-        logger.info("=== Method 3: NSE API ===")
-        api_symbols = self.fetch_from_nse_api()
-        if api_symbols:
-            all_symbols.extend(api_symbols)
-            logger.info(f"✓ NSE API: {len(api_symbols)} symbols")
-        else:
-            logger.warning("✗ NSE API: Failed")
-        
-        # Method 4: Try Bhavcopy
-        logger.info("=== Method 4: NSE Bhavcopy ===")
-        bhavcopy_symbols = self.fetch_from_bhavcopy()
-        if bhavcopy_symbols:
-            all_symbols.extend(bhavcopy_symbols)
-            logger.info(f"✓ Bhavcopy: {len(bhavcopy_symbols)} symbols")
-        else:
-            logger.warning("✗ Bhavcopy: Failed")
-        
-        # Remove duplicates while preserving company names and sectors
-        unique_symbols = {}
-        for stock in all_symbols:
-            symbol = stock['symbol']
-            if symbol not in unique_symbols:
-                unique_symbols[symbol] = stock
-            else:
-                # Update with better information if available
-                existing = unique_symbols[symbol]
-                if not existing['company_name'] and stock['company_name']:
-                    existing['company_name'] = stock['company_name']
-                if not existing['sector'] and stock['sector']:
-                    existing['sector'] = stock['sector']
-                if not existing['industry'] and stock['industry']:
-                    existing['industry'] = stock['industry']
+        # Sources in priority order: earlier sources win when symbols are merged
+        sources = [
+            ('nsetools', self.fetch_from_nsetools),
+            ('Nifty Indices', self.fetch_from_nifty_indices),
+            ('NSE API', self.fetch_from_nse_api),
+            ('Bhavcopy', self.fetch_from_bhavcopy),
+        ]
         
-        final_symbols = list(unique_symbols.values())
+        # The sources are independent network fetches, so run them concurrently
+        with ThreadPoolExecutor(max_workers=len(sources)) as executor:
+            futures = [(name, executor.submit(fetch)) for name, fetch in sources]
+            
+            for name, future in futures:
+                try:
+                    source_symbols = future.result()
+                except Exception as e:
+                    logger.error(f"Error fetching from {name}: {e}")
+                    source_symbols = []
+                
+                if source_symbols:
+                    all_symbols.extend(source_symbols)
+                    logger.info(f"✓ {name}: {len(source_symbols)} symbols")
+                else:
+                    logger.warning(f"✗ {name}: Failed")
         
-        # Sort by symbol for consistency
-        final_symbols.sort(key=lambda x: x['symbol'])
+        # Remove duplicates while preserving company names and sectors: each
+        # field takes the first non-empty value across sources, in priority order
+        final_symbols = []
+        if all_symbols:
+            text_columns = ['company_name', 'sector', 'industry']
+            merged = pd.DataFrame(all_symbols, columns=self.STOCK_COLUMNS)
+            merged[text_columns] = merged[text_columns].replace('', None)
+            # Sorted by symbol for consistency
+            merged = merged.groupby('symbol', sort=True).first().reset_index()
+            merged[text_columns] = merged[text_columns].fillna('')
+            final_symbols = merged.astype(object).where(merged.notna(), None).to_dict('records')
         
         logger.info(f"=== FINAL RESULT ===")
         logger.info(f"Total unique NSE symbols fetched dynamically: {len(final_symbols)}")
@@ -377,6 +426,25 @@ class DynamicNSEFetcher:
             logger.error("❌ All dynamic methods failed")
             return []
     
+    def _has_recent_history(self, symbol: str) -> bool:
+        """
+        Check whether Yahoo Finance has price history for a symbol
+        """
+        try:
+            import yfinance as yf
+            ticker = yf.Ticker(symbol)
+            hist = ticker.history(period="1d")
+            
+            if not hist.empty:
+                logger.debug(f"✓ {symbol} - Valid")
+                return True
+            logger.debug(f"✗ {symbol} - No data")
+            
+        except Exception as e:
+            logger.debug(f"✗ {symbol} - Error: {e}")
+        
+        return False
+    
     def test_symbol_validity(self, symbols: List[Dict], sample_size: int = 10) -> float:
         """
         Test a sample of symbols to check validity
@@ -385,26 +453,13 @@ class DynamicNSEFetcher:
             return 0.0
         
         sample = symbols[:min(sample_size, len(symbols))]
-        valid_count = 0
         
         logger.info(f"Testing {len(sample)} symbols for validity...")
         
-        for stock in sample:
-            try:
-                import yfinance as yf
-                ticker = yf.Ticker(stock['symbol'])
-                hist = ticker.history(period="1d")
-                
-                if not hist.empty:
-                    valid_count += 1
-                    logger.debug(f"✓ {stock['symbol']} - Valid")
-                else:
-                    logger.debug(f"✗ {stock['symbol']} - No data")
-                    
-            except Exception as e:
-                logger.debug(f"✗ {stock['symbol']} - Error: {e}")
-            
-            time.sleep(0.1)  # Rate limiting
+        # Each check is an independent network round trip, so run them
+        # concurrently; the worker count bounds the request rate
+        with ThreadPoolExecutor(max_workers=min(self.VALIDITY_CHECK_WORKERS, len(sample))) as executor:
+            valid_count = sum(executor.map(self._has_recent_history, (stock['symbol'] for stock in sample)))
         
         validity_rate = (valid_count / len(sample)) * 100
         logger.info(f"Validity test: {valid_count}/{len(sample)} symbols valid ({validity_rate:.1f}%)")
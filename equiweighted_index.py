@@ -4,11 +4,14 @@ import numpy as np
 import logging
 from datetime import datetime, timedelta
 from config import Config
-from database import TimescaleDBManager
+from database import TimescaleDBManager, enable_compression
 import psycopg2.extras
 import matplotlib.pyplot as plt
 from matplotlib.dates import DateFormatter
+import io
 import os
+from itertools import groupby
+from operator import itemgetter
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
@@ -20,10 +23,50 @@ class EquiweightedIndexGenerator:
     and store them in the database
     """
     
+    # Secondary indexes on equiweighted_indices; dropped and rebuilt around a
+    # fast re-index so bulk loads don't maintain them row by row. Both match
+    # the index_data_query filters on a name or type plus a time range
+    SECONDARY_INDEXES = {
+        'idx_eqi_name_time': """
+            CREATE INDEX IF NOT EXISTS idx_eqi_name_time 
+            ON equiweighted_indices (index_name, time DESC);
+        """,
+        'idx_eqi_type_time': """
+            CREATE INDEX IF NOT EXISTS idx_eqi_type_time 
+            ON equiweighted_indices (index_type, time DESC);
+        """,
+    }
+    
+    # Single-column indexes superseded by the composite ones above
+    RETIRED_INDEXES = ['idx_equiweighted_indices_name', 'idx_equiweighted_indices_type']
+    
+    # Rows fetched per round trip when iterating index data
+    ROW_BATCH_SIZE = 5000
+    
+    # Where index values are read from for each plotting/data resolution, and
+    # the column holding their timestamps
+    INDEX_DATA_SOURCES = {
+        'daily': ('equiweighted_indices', 'time'),
+        'weekly': ('equiweighted_indices_weekly', 'bucket'),
+    }
+    
+    # Index type of each GROUPING(sector, industry) level in _get_category_returns
+    GROUPING_INDEX_TYPES = {0: 'sector_industry', 1: 'sector', 2: 'industry'}
+    
     def __init__(self):
         self.config = Config()
         self.db = TimescaleDBManager()
     
+    def __enter__(self):
+        """Hold one database connection for the work done inside the block"""
+        if not self.db.connect():
+            raise psycopg2.OperationalError("Failed to connect to database")
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.db.close()
+        return False
+    
     def create_index_table(self):
         """Create the table to store index values if it doesn't exist"""
         if not self.db.connect():
@@ -45,21 +88,55 @@ class EquiweightedIndexGenerator:
                     );
                 """)
                 
-                # Create hypertable
+                # Create hypertable; one value per index per day fits month-long
+                # chunks, so a year-long chart reads about 12 chunks instead of 52
                 cursor.execute("""
                     SELECT create_hypertable('equiweighted_indices', 'time', 
+                                           chunk_time_interval => INTERVAL '30 days',
                                            if_not_exists => TRUE);
                 """)
                 
+                # Existing hypertables use the new interval for chunks created from now on
+                cursor.execute("""
+                    SELECT set_chunk_time_interval('equiweighted_indices', INTERVAL '30 days');
+                """)
+                
                 # Create indices for better performance
+                for index_name in self.RETIRED_INDEXES:
+                    cursor.execute(f"DROP INDEX IF EXISTS {index_name};")
+                
+                for create_sql in self.SECONDARY_INDEXES.values():
+                    cursor.execute(create_sql)
+                
+                # Compress chunks once they are older than the window
+                # generate_all_indices rewrites; segmenting by index_name lets
+                # get_index_data's index_name filter skip whole segments
+                enable_compression(cursor, 'equiweighted_indices', 'index_name',
+                                   self.config.COMPRESS_AFTER_DAYS)
+                
+                # Last value of each week per index, for long-range charts
                 cursor.execute("""
-                    CREATE INDEX IF NOT EXISTS idx_equiweighted_indices_name 
-                    ON equiweighted_indices (index_name);
+                    CREATE MATERIALIZED VIEW IF NOT EXISTS equiweighted_indices_weekly
+                    WITH (timescaledb.continuous) AS
+                    SELECT 
+                        time_bucket(INTERVAL '1 week', time) AS bucket,
+                        index_name,
+                        index_type,
+                        last(index_value, time) AS index_value,
+                        last(constituent_count, time) AS constituent_count
+                    FROM equiweighted_indices
+                    GROUP BY bucket, index_name, index_type
+                    WITH NO DATA;
                 """)
                 
+                # Keeps recent weeks current; generation runs rewrite the whole
+                # history and refresh the aggregate in full themselves
                 cursor.execute("""
-                    CREATE INDEX IF NOT EXISTS idx_equiweighted_indices_type 
-                    ON equiweighted_indices (index_type);
+                    SELECT add_continuous_aggregate_policy('equiweighted_indices_weekly',
+                                                           start_offset => INTERVAL '1 month',
+                                                           end_offset => INTERVAL '1 day',
+                                                           schedule_interval => INTERVAL '1 day',
+                                                           if_not_exists => TRUE);
                 """)
                 
                 self.db.connection.commit()
@@ -73,267 +150,255 @@ class EquiweightedIndexGenerator:
         finally:
             self.db.close()
     
-    def generate_all_indices(self, start_date=None, end_date=None):
+    def generate_all_indices(self, start_date=None, end_date=None, fast_reindex=False):
         """
         Generate equiweighted indices for all sectors, industries and their combinations
         
         Args:
-            start_date: Start date for index calculation (defaults to 1 year ago)
+            start_date: Start date for index calculation (defaults to
+                HISTORY_DAYS ago)
             end_date: End date for index calculation (defaults to today)
+            fast_reindex: Drop the secondary indexes during the load and
+                rebuild them afterwards
         """
         logger.info("Generating all equiweighted indices...")
         
         if start_date is None:
-            start_date = datetime.now() - timedelta(days=365)
+            start_date = datetime.now() - timedelta(days=self.config.HISTORY_DAYS)
         if end_date is None:
             end_date = datetime.now()
-            
-        # 1. Generate sector indices
-        self.generate_sector_indices(start_date, end_date)
         
-        # 2. Generate industry indices
-        self.generate_industry_indices(start_date, end_date)
+        if start_date < datetime.now() - timedelta(days=self.config.COMPRESS_AFTER_DAYS):
+            logger.warning(f"Regenerating from {start_date:%Y-%m-%d} rewrites compressed "
+                           f"chunks (older than {self.config.COMPRESS_AFTER_DAYS} days); "
+                           f"this needs TimescaleDB 2.11+")
         
-        # 3. Generate sector-industry combination indices
-        self.generate_sector_industry_indices(start_date, end_date)
+        # Every step below runs on this one connection
+        with self:
+            if fast_reindex:
+                self._drop_secondary_indexes()
+            
+            try:
+                self._generate_and_store(start_date, end_date)
+            finally:
+                if fast_reindex:
+                    self._create_secondary_indexes()
+            
+            self._refresh_weekly_aggregate()
+            
+            # Refresh the precomputed sector-industry combinations
+            self.db.refresh_materialized_views()
         
         logger.info("All indices generated successfully")
     
-    def generate_sector_indices(self, start_date, end_date):
-        """Generate equiweighted indices for each sector"""
-        logger.info("Generating sector indices...")
-        
-        if not self.db.connect():
-            logger.error("Failed to connect to database")
-            return False
-        
+    def _generate_and_store(self, start_date, end_date):
+        """
+        Compute every index from one stocks query and one returns query,
+        then store them all together
+        """
         try:
-            # Get all sectors
-            with self.db.connection.cursor() as cursor:
-                cursor.execute("""
-                    SELECT DISTINCT sector 
-                    FROM stocks 
-                    WHERE sector IS NOT NULL AND sector != '' 
-                    ORDER BY sector
-                """)
-                sectors = [row[0] for row in cursor.fetchall()]
+            # 1. Constituents of every sector, industry and sector-industry index
+            categories = self._load_categories()
+            if not categories:
+                logger.warning("No categorised stocks found")
+                return False
             
-            for sector in sectors:
-                logger.info(f"Generating index for sector: {sector}")
-                self._generate_index_for_category("sector", sector, None, start_date, end_date)
-                
-            logger.info(f"Generated indices for {len(sectors)} sectors")
-            return True
+            # 2. Daily sums of constituent returns for every index, aggregated in the database
+            category_returns = self._get_category_returns(start_date, end_date)
             
-        except Exception as e:
-            logger.error(f"Error generating sector indices: {e}")
-            return False
-        finally:
-            self.db.close()
-    
-    def generate_industry_indices(self, start_date, end_date):
-        """Generate equiweighted indices for each industry"""
-        logger.info("Generating industry indices...")
-        
-        if not self.db.connect():
-            logger.error("Failed to connect to database")
-            return False
-        
-        try:
-            # Get all industries
-            with self.db.connection.cursor() as cursor:
-                cursor.execute("""
-                    SELECT DISTINCT industry 
-                    FROM stocks 
-                    WHERE industry IS NOT NULL AND industry != '' 
-                    ORDER BY industry
-                """)
-                industries = [row[0] for row in cursor.fetchall()]
+            # 3. Compound each index from its daily returns
+            frames = []
+            for index_type, sector, industry, stocks in categories:
+                index_rows = self._generate_index_for_category(
+                    index_type, sector, industry, stocks,
+                    category_returns.get((index_type, sector, industry))
+                )
+                if index_rows is not None:
+                    frames.append(index_rows)
             
-            for industry in industries:
-                logger.info(f"Generating index for industry: {industry}")
-                self._generate_index_for_category("industry", None, industry, start_date, end_date)
-                
-            logger.info(f"Generated indices for {len(industries)} industries")
-            return True
+            logger.info(f"Generated {len(frames)} of {len(categories)} indices")
+            
+            # 4. Store every index in one load ordered by time, so the writes move
+            # through the hypertable chunks once instead of once per index
+            if not frames:
+                return False
+            index_rows = pd.concat(frames, ignore_index=True).sort_values('time', kind='mergesort')
+            return self._store_index_values(index_rows)
             
         except Exception as e:
-            logger.error(f"Error generating industry indices: {e}")
+            logger.error(f"Error generating indices: {e}")
             return False
         finally:
-            self.db.close()
+            # End the read transaction a failed or empty run leaves open
+            self.db.connection.rollback()
     
-    def generate_sector_industry_indices(self, start_date, end_date):
-        """Generate equiweighted indices for each sector-industry combination"""
-        logger.info("Generating sector-industry combination indices...")
-        
-        if not self.db.connect():
-            logger.error("Failed to connect to database")
-            return False
+    def _load_categories(self):
+        """
+        Get the constituents of every index in one query
         
-        try:
-            # Get all sector-industry combinations
-            with self.db.connection.cursor() as cursor:
-                cursor.execute("""
-                    SELECT DISTINCT sector, industry 
-                    FROM stocks 
-                    WHERE sector IS NOT NULL AND sector != '' 
-                      AND industry IS NOT NULL AND industry != '' 
-                    ORDER BY sector, industry
-                """)
-                combinations = cursor.fetchall()
-            
-            for sector, industry in combinations:
-                logger.info(f"Generating index for sector-industry: {sector}-{industry}")
-                self._generate_index_for_category("sector_industry", sector, industry, start_date, end_date)
-                
-            logger.info(f"Generated indices for {len(combinations)} sector-industry combinations")
-            return True
-            
-        except Exception as e:
-            logger.error(f"Error generating sector-industry indices: {e}")
-            return False
-        finally:
-            self.db.close()
+        Returns:
+            List of (index_type, sector, industry, symbols) tuples: sectors, then
+            industries, then sector-industry combinations, each in name order
+        """
+        with self.db.connection.cursor() as cursor:
+            cursor.execute("""
+                SELECT NULLIF(sector, ''), NULLIF(industry, ''), symbol 
+                FROM stocks 
+                WHERE (sector IS NOT NULL AND sector != '') 
+                   OR (industry IS NOT NULL AND industry != '')
+            """)
+            rows = cursor.fetchall()
+        
+        by_sector, by_industry, by_combination = {}, {}, {}
+        for sector, industry, symbol in rows:
+            if sector:
+                by_sector.setdefault(sector, []).append(symbol)
+            if industry:
+                by_industry.setdefault(industry, []).append(symbol)
+            if sector and industry:
+                by_combination.setdefault((sector, industry), []).append(symbol)
+        
+        return (
+            [("sector", sector, None, by_sector[sector]) for sector in sorted(by_sector)] +
+            [("industry", None, industry, by_industry[industry]) for industry in sorted(by_industry)] +
+            [("sector_industry", sector, industry, by_combination[(sector, industry)])
+             for sector, industry in sorted(by_combination)]
+        )
     
-    def _generate_index_for_category(self, index_type, sector, industry, start_date, end_date):
+    def _generate_index_for_category(self, index_type, sector, industry, stocks, daily_returns):
         """
         Generate an equiweighted index for a given category
         
+        Returns a DataFrame of rows to store, or None if the index could not be built.
+        
         Args:
             index_type: Type of index ('sector', 'industry', or 'sector_industry')
             sector: Sector name (or None for industry-only indices)
             industry: Industry name (or None for sector-only indices)
-            start_date: Start date for index calculation
-            end_date: End date for index calculation
+            stocks: Symbols of the stocks in this category
+            daily_returns: DataFrame from _get_category_returns for this category, or None
         """
-        # Connect to database
-        if not self.db.connect():
-            logger.error("Failed to connect to database")
-            return False
+        # Determine the index name
+        if index_type == "sector":
+            index_name = f"SECTOR-{sector}"
+        elif index_type == "industry":
+            index_name = f"INDUSTRY-{industry}"
+        else:  # sector_industry
+            index_name = f"SECTOR-INDUSTRY-{sector}-{industry}"
+        
+        logger.info(f"Generating index for {index_name}")
         
         try:
-            # Determine the index name and query conditions
-            if index_type == "sector":
-                index_name = f"SECTOR-{sector}"
-                where_clause = "s.sector = %s"
-                params = [sector]
-            elif index_type == "industry":
-                index_name = f"INDUSTRY-{industry}"
-                where_clause = "s.industry = %s"
-                params = [industry]
-            else:  # sector_industry
-                index_name = f"SECTOR-INDUSTRY-{sector}-{industry}"
-                where_clause = "s.sector = %s AND s.industry = %s"
-                params = [sector, industry]
-            
-            # 1. Get all stocks in this category
-            with self.db.connection.cursor() as cursor:
-                cursor.execute(f"""
-                    SELECT s.symbol 
-                    FROM stocks s 
-                    WHERE {where_clause}
-                """, params)
-                stocks = [row[0] for row in cursor.fetchall()]
-            
-            if not stocks:
-                logger.warning(f"No stocks found for {index_type}: {sector if sector else ''} {industry if industry else ''}")
-                return False
-            
-            # 2. Get historical prices for these stocks
-            price_data = self._get_historical_prices(stocks, start_date, end_date)
-            
-            if price_data.empty:
+            if daily_returns is None or daily_returns.empty:
                 logger.warning(f"No price data found for {index_type}: {sector if sector else ''} {industry if industry else ''}")
-                return False
+                return None
             
-            # 3. Calculate the equiweighted index
-            index_values = self._calculate_equiweighted_index(price_data)
+            # 1. Calculate the equiweighted index
+            index_values = self._calculate_equiweighted_index(daily_returns)
             
-            # 4. Store the index in the database
-            self._store_index_values(index_name, index_type, index_values, len(stocks))
+            if index_values.empty:
+                logger.warning(f"No index values calculated for {index_name}")
+                return None
             
             logger.info(f"Successfully generated index for {index_name} with {len(stocks)} constituents")
-            return True
+            
+            # 2. Rows to store for this index
+            return index_values.assign(
+                index_name=index_name,
+                index_type=index_type,
+                constituent_count=len(stocks)
+            )
             
         except Exception as e:
             logger.error(f"Error generating index for {index_type}: {sector if sector else ''} {industry if industry else ''}: {e}")
-            return False
-        finally:
-            self.db.close()
+            return None
     
-    def _get_historical_prices(self, symbols, start_date, end_date):
+    def _get_category_returns(self, start_date, end_date):
         """
-        Get historical prices for a list of symbols
+        Get the daily return sums of every sector, industry and sector-industry
+        index in one query
+        
+        Each stock's return is taken against its previous close in the window,
+        so it spans days the stock did not trade. Only one row per index and
+        day comes back instead of one per stock and day.
         
         Args:
-            symbols: List of stock symbols
             start_date: Start date for price data
             end_date: End date for price data
             
         Returns:
-            DataFrame with price data
+            Dict mapping (index_type, sector, industry) to a DataFrame with time,
+            return_sum (sum of constituent returns that day) and starts (number
+            of constituents whose first price in the window is that day)
         """
-        try:
-            # Format dates for SQL
-            start_date_str = start_date.strftime('%Y-%m-%d')
-            end_date_str = end_date.strftime('%Y-%m-%d')
-            
-            # Get price data
-            with self.db.connection.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cursor:
-                cursor.execute("""
-                    SELECT time, symbol, close_price
-                    FROM stock_prices
-                    WHERE symbol = ANY(%s)
-                      AND time BETWEEN %s AND %s
-                    ORDER BY time
-                """, (symbols, start_date_str, end_date_str))
-                
-                rows = cursor.fetchall()
-            
-            if not rows:
-                return pd.DataFrame()
-            
-            # Convert to DataFrame
-            df = pd.DataFrame(rows)
-            
-            # Pivot to have symbols as columns
-            pivot_df = df.pivot(index='time', columns='symbol', values='close_price')
-            
-            return pivot_df
-            
-        except Exception as e:
-            logger.error(f"Error getting historical prices: {e}")
-            return pd.DataFrame()
+        # Format dates for SQL
+        start_date_str = start_date.strftime('%Y-%m-%d')
+        end_date_str = end_date.strftime('%Y-%m-%d')
+        
+        # Server-side cursor, so rows are fetched in batches as they are grouped
+        with self.db.connection.cursor(name='category_returns') as cursor:
+            cursor.itersize = self.ROW_BATCH_SIZE
+            cursor.execute("""
+                WITH returns AS (
+                    SELECT 
+                        p.time,
+                        NULLIF(s.sector, '') AS sector,
+                        NULLIF(s.industry, '') AS industry,
+                        p.close_price::float8 AS close,
+                        LAG(p.close_price::float8) OVER (PARTITION BY p.symbol ORDER BY p.time) AS prev_close
+                    FROM stock_prices p
+                    JOIN stocks s ON s.symbol = p.symbol
+                    WHERE p.time BETWEEN %s AND %s
+                      AND (NULLIF(s.sector, '') IS NOT NULL OR NULLIF(s.industry, '') IS NOT NULL)
+                )
+                SELECT 
+                    GROUPING(sector, industry) AS level,
+                    sector,
+                    industry,
+                    time,
+                    -- A return off a zero close is NULL and left out of the sum
+                    COALESCE(SUM(close / NULLIF(prev_close, 0) - 1), 0) AS return_sum,
+                    COUNT(*) FILTER (WHERE prev_close IS NULL) AS starts
+                FROM returns
+                GROUP BY GROUPING SETS ((sector, time), (industry, time), (sector, industry, time))
+                ORDER BY level, sector, industry, time
+            """, (start_date_str, end_date_str))
+            
+            category_returns = {}
+            for (level, sector, industry), rows in groupby(cursor, key=itemgetter(0, 1, 2)):
+                times, return_sums, starts = zip(*(row[3:] for row in rows))
+                category_returns[(self.GROUPING_INDEX_TYPES[level], sector, industry)] = pd.DataFrame({
+                    'time': times,
+                    'return_sum': return_sums,
+                    'starts': starts
+                })
+        
+        return category_returns
     
-    def _calculate_equiweighted_index(self, price_data, base_value=1000):
+    def _calculate_equiweighted_index(self, daily_returns, base_value=1000):
         """
-        Calculate an equiweighted index from price data
+        Calculate an equiweighted index from its constituents' daily returns
         
         Args:
-            price_data: DataFrame with price data (time as index, symbols as columns)
+            daily_returns: DataFrame with time, return_sum and starts columns
             base_value: Starting value for the index (default: 1000)
             
         Returns:
             DataFrame with index values
         """
         try:
-            # Calculate returns for each stock
-            returns = price_data.pct_change().fillna(0)
+            # Every stock priced in the window weighs in every day, with a zero
+            # return before its first price and on days it did not trade
+            constituents = daily_returns['starts'].sum()
+            equiweighted_returns = daily_returns['return_sum'].to_numpy(dtype=np.float64) / constituents
             
-            # Calculate the equiweighted index returns
-            equiweighted_returns = returns.mean(axis=1)
-            
-            # Calculate cumulative returns
-            cum_returns = (1 + equiweighted_returns).cumprod()
-            
-            # Create the index series starting at base_value
-            index_values = base_value * cum_returns
+            # Compound the returns from base_value
+            index_values = base_value * np.cumprod(1 + equiweighted_returns)
             
             # Create a DataFrame with the index values
             index_df = pd.DataFrame({
-                'time': index_values.index,
-                'index_value': index_values.values
+                'time': daily_returns['time'],
+                'index_value': index_values
             })
             
             return index_df
@@ -342,95 +407,187 @@ class EquiweightedIndexGenerator:
             logger.error(f"Error calculating equiweighted index: {e}")
             return pd.DataFrame()
     
-    def _store_index_values(self, index_name, index_type, index_values, constituent_count):
+    def _refresh_weekly_aggregate(self):
+        """Re-materialize the weekly continuous aggregate over the whole history"""
+        try:
+            # CALL refresh_continuous_aggregate cannot run inside a transaction block
+            self.db.connection.autocommit = True
+            with self.db.connection.cursor() as cursor:
+                cursor.execute("CALL refresh_continuous_aggregate('equiweighted_indices_weekly', NULL, NULL);")
+            
+            logger.info("Refreshed weekly index aggregate")
+            return True
+            
+        except Exception as e:
+            logger.warning(f"Error refreshing weekly index aggregate: {e}")
+            return False
+        finally:
+            if not self.db.connection.closed:
+                self.db.connection.autocommit = False
+    
+    def _drop_secondary_indexes(self):
+        """Drop the secondary indexes on equiweighted_indices before a bulk load"""
+        try:
+            with self.db.connection.cursor() as cursor:
+                for index_name in self.SECONDARY_INDEXES:
+                    cursor.execute(f"DROP INDEX IF EXISTS {index_name};")
+            
+            self.db.connection.commit()
+            logger.info("Dropped secondary indexes for fast re-index")
+            return True
+            
+        except Exception as e:
+            logger.error(f"Error dropping secondary indexes: {e}")
+            self.db.connection.rollback()
+            return False
+    
+    def _create_secondary_indexes(self):
+        """Rebuild the secondary indexes on equiweighted_indices after a bulk load"""
+        try:
+            with self.db.connection.cursor() as cursor:
+                for create_sql in self.SECONDARY_INDEXES.values():
+                    cursor.execute(create_sql)
+            
+            self.db.connection.commit()
+            logger.info("Rebuilt secondary indexes")
+            return True
+            
+        except Exception as e:
+            logger.error(f"Error rebuilding secondary indexes: {e}")
+            self.db.connection.rollback()
+            return False
+    
+    def _store_index_values(self, index_rows):
         """
         Store index values in the database
         
+        Rows are COPYed into a temporary staging table and upserted from there
+        in one statement, since COPY cannot resolve conflicts itself.
+        
         Args:
-            index_name: Name of the index
-            index_type: Type of index ('sector', 'industry', or 'sector_industry')
-            index_values: DataFrame with index values
-            constituent_count: Number of stocks in the index
+            index_rows: DataFrame with time, index_name, index_type, index_value
+                and constituent_count columns
         """
-        if index_values.empty:
-            logger.warning(f"No index values to store for {index_name}")
+        if index_rows.empty:
+            logger.warning("No index values to store")
             return False
         
+        buffer = io.StringIO()
+        index_rows[['time', 'index_name', 'index_type', 'index_value', 'constituent_count']].to_csv(
+            buffer, index=False, header=False
+        )
+        buffer.seek(0)
+        
         try:
-            # Insert index values in batches
             with self.db.connection.cursor() as cursor:
-                for _, row in index_values.iterrows():
-                    cursor.execute("""
-                        INSERT INTO equiweighted_indices
-                        (time, index_name, index_type, index_value, constituent_count)
-                        VALUES (%s, %s, %s, %s, %s)
-                        ON CONFLICT (time, index_name) 
-                        DO UPDATE SET 
-                            index_value = EXCLUDED.index_value,
-                            constituent_count = EXCLUDED.constituent_count
-                    """, (
-                        row['time'], 
-                        index_name, 
-                        index_type, 
-                        float(row['index_value']), 
-                        constituent_count
-                    ))
+                cursor.execute("""
+                    CREATE TEMP TABLE IF NOT EXISTS equiweighted_indices_staging 
+                    (LIKE equiweighted_indices INCLUDING DEFAULTS) 
+                    ON COMMIT DELETE ROWS;
+                """)
+                
+                cursor.copy_expert("""
+                    COPY equiweighted_indices_staging 
+                    (time, index_name, index_type, index_value, constituent_count) 
+                    FROM STDIN WITH (FORMAT csv)
+                """, buffer)
+                
+                cursor.execute("""
+                    INSERT INTO equiweighted_indices
+                    (time, index_name, index_type, index_value, constituent_count)
+                    SELECT time, index_name, index_type, index_value, constituent_count
+                    FROM equiweighted_indices_staging
+                    ON CONFLICT (time, index_name) 
+                    DO UPDATE SET 
+                        index_value = EXCLUDED.index_value,
+                        constituent_count = EXCLUDED.constituent_count
+                """)
                 
                 self.db.connection.commit()
-                logger.info(f"Stored {len(index_values)} index values for {index_name}")
+                logger.info(f"Stored {len(index_rows)} index values for {index_rows['index_name'].nunique()} indices")
                 return True
                 
         except Exception as e:
-            logger.error(f"Error storing index values for {index_name}: {e}")
+            logger.error(f"Error storing index values: {e}")
             self.db.connection.rollback()
             return False
     
-    def get_index_data(self, index_name=None, index_type=None, start_date=None, end_date=None):
+    @staticmethod
+    def index_data_query(index_name=None, index_type=None, start_date=None, end_date=None,
+                         resolution='daily'):
+        """Build the SQL and parameters selecting index values in time order"""
+        table, time_column = EquiweightedIndexGenerator.INDEX_DATA_SOURCES[resolution]
+        time_select = time_column if time_column == 'time' else f"{time_column} AS time"
+        query = f"""
+            SELECT {time_select}, index_name, index_type, index_value, constituent_count
+            FROM {table}
+            WHERE 1=1
         """
-        Get index data from the database
+        params = []
+        
+        if index_name:
+            query += " AND index_name = %s"
+            params.append(index_name)
+        
+        if index_type:
+            query += " AND index_type = %s"
+            params.append(index_type)
+        
+        if start_date:
+            query += f" AND {time_column} >= %s"
+            params.append(start_date)
+        
+        if end_date:
+            query += f" AND {time_column} <= %s"
+            params.append(end_date)
+        
+        query += " ORDER BY time"
+        return query, params
+    
+    def iter_index_rows(self, index_name=None, index_type=None, start_date=None, end_date=None,
+                        resolution='daily'):
+        """
+        Yield index rows as dicts without building a DataFrame
         
         Args:
             index_name: Name of the index (optional)
             index_type: Type of index (optional)
             start_date: Start date for data (optional)
             end_date: End date for data (optional)
-            
-        Returns:
-            DataFrame with index data
+            resolution: 'daily' values, or 'weekly' ones from the continuous aggregate
         """
         if not self.db.connect():
             logger.error("Failed to connect to database")
-            return pd.DataFrame()
+            return
         
         try:
-            query = """
-                SELECT time, index_name, index_type, index_value, constituent_count
-                FROM equiweighted_indices
-                WHERE 1=1
-            """
-            params = []
-            
-            if index_name:
-                query += " AND index_name = %s"
-                params.append(index_name)
-            
-            if index_type:
-                query += " AND index_type = %s"
-                params.append(index_type)
+            query, params = self.index_data_query(index_name, index_type, start_date, end_date, resolution)
             
-            if start_date:
-                query += " AND time >= %s"
-                params.append(start_date)
-            
-            if end_date:
-                query += " AND time <= %s"
-                params.append(end_date)
-            
-            query += " ORDER BY time"
-            
-            with self.db.connection.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cursor:
+            # Server-side cursor, so the rows are fetched in batches as they are consumed
+            with self.db.connection.cursor(name='index_rows', cursor_factory=psycopg2.extras.RealDictCursor) as cursor:
+                cursor.itersize = self.ROW_BATCH_SIZE
                 cursor.execute(query, params)
-                rows = cursor.fetchall()
+                yield from cursor
+        finally:
+            self.db.close()
+    
+    def get_index_data(self, index_name=None, index_type=None, start_date=None, end_date=None,
+                       resolution='daily'):
+        """
+        Get index data from the database
+        
+        Args:
+            index_name: Name of the index (optional)
+            index_type: Type of index (optional)
+            start_date: Start date for data (optional)
+            end_date: End date for data (optional)
+            resolution: 'daily' values, or 'weekly' ones from the continuous aggregate
+            
+        Returns:
+            DataFrame with index data
+        """
+        try:
+            rows = list(self.iter_index_rows(index_name, index_type, start_date, end_date, resolution))
             
             if not rows:
                 return pd.DataFrame()
@@ -443,11 +600,9 @@ class EquiweightedIndexGenerator:
         except Exception as e:
             logger.error(f"Error getting index data: {e}")
             return pd.DataFrame()
-        finally:
-            self.db.close()
     
     def plot_indices(self, index_names=None, index_type=None, start_date=None, end_date=None, 
-                     save_dir="index_charts", save_format="png"):
+                     save_dir="index_charts", save_format="png", resolution="daily"):
         """
         Plot indices and save the charts
         
@@ -458,6 +613,7 @@ class EquiweightedIndexGenerator:
             end_date: End date for data (optional)
             save_dir: Directory to save charts (default: "index_charts")
             save_format: Format to save charts (default: "png")
+            resolution: Data resolution to plot, "daily" or "weekly" (default: "daily")
         """
         # Create save directory if it doesn't exist
         os.makedirs(save_dir, exist_ok=True)
@@ -466,18 +622,21 @@ class EquiweightedIndexGenerator:
         if index_names:
             # Plot each index separately
             for index_name in index_names:
-                df = self.get_index_data(index_name=index_name, start_date=start_date, end_date=end_date)
+                df = self.get_index_data(index_name=index_name, start_date=start_date, end_date=end_date,
+                                         resolution=resolution)
                 if not df.empty:
                     self._plot_single_index(df, save_dir, save_format)
         elif index_type:
             # Plot all indices of this type on the same chart
-            df = self.get_index_data(index_type=index_type, start_date=start_date, end_date=end_date)
+            df = self.get_index_data(index_type=index_type, start_date=start_date, end_date=end_date,
+                                     resolution=resolution)
             if not df.empty:
                 self._plot_multiple_indices(df, index_type, save_dir, save_format)
         else:
             # Plot all types of indices
             for type_name in ["sector", "industry", "sector_industry"]:
-                df = self.get_index_data(index_type=type_name, start_date=start_date, end_date=end_date)
+                df = self.get_index_data(index_type=type_name, start_date=start_date, end_date=end_date,
+                                         resolution=resolution)
                 if not df.empty:
                     self._plot_multiple_indices(df, type_name, save_dir, save_format)
     
@@ -538,7 +697,7 @@ class EquiweightedIndexGenerator:
             df_filtered = df[df['index_name'].isin(top_indices)]
             
             # Pivot the data
-            pivot_df = df_filtered.pivot(index='time', columns='index_name', values='index_value')
+            pivot_df = df_filtered.set_index(['time', 'index_name'])['index_value'].unstack('index_name')
             
             # Plot the data
             plt.figure(figsize=(14, 8))
@@ -564,7 +723,7 @@ class EquiweightedIndexGenerator:
             logger.info(f"Saved chart for top 10 {index_type} indices")
         else:
             # Pivot the data
-            pivot_df = df.pivot(index='time', columns='index_name', values='index_value')
+            pivot_df = df.set_index(['time', 'index_name'])['index_value'].unstack('index_name')
             
             # Plot the data
             plt.figure(figsize=(14, 8))
@@ -604,6 +763,8 @@ if __name__ == "__main__":
                         help='Type of index to plot')
     parser.add_argument('--save-dir', type=str, default='index_charts', help='Directory to save charts')
     parser.add_argument('--save-format', type=str, default='png', help='Format to save charts')
+    parser.add_argument('--resolution', type=str, choices=['daily', 'weekly'], default='daily',
+                        help='Data resolution to plot')
     
     args = parser.parse_args()
     
@@ -631,10 +792,13 @@ if __name__ == "__main__":
     if args.plot:
         if args.index_name:
             generator.plot_indices(index_names=[args.index_name], start_date=start_date, end_date=end_date,
-                                 save_dir=args.save_dir, save_format=args.save_format)
+                                 save_dir=args.save_dir, save_format=args.save_format,
+                                 resolution=args.resolution)
         elif args.index_type:
             generator.plot_indices(index_type=args.index_type, start_date=start_date, end_date=end_date,
-                                 save_dir=args.save_dir, save_format=args.save_format)
+                                 save_dir=args.save_dir, save_format=args.save_format,
+                                 resolution=args.resolution)
         else:
             generator.plot_indices(start_date=start_date, end_date=end_date,
-                                 save_dir=args.save_dir, save_format=args.save_format)
+                                 save_dir=args.save_dir, save_format=args.save_format,
+                                 resolution=args.resolution)
@@ -95,6 +95,7 @@ def enrich_existing_stocks_with_sectors():
             time.sleep(3)
         
         logger.info(f"✅ Successfully enriched {enriched_count} stocks with sector information")
+        db.refresh_materialized_views()
         db.close()
         return True
         
@@ -215,16 +216,18 @@ def setup_stocks():
         batch_size = 50
         success_count = 0
         
-        for i in range(0, len(stocks_info), batch_size):
-            batch = stocks_info[i:i + batch_size]
-            if db.insert_stocks(batch):
-                success_count += len(batch)
-                logger.info(f"Inserted batch {i//batch_size + 1}: {len(batch)} stocks")
-            else:
-                logger.error(f"Failed to insert batch {i//batch_size + 1}")
+        with db.bulk_mode():
+            for i in range(0, len(stocks_info), batch_size):
+                batch = stocks_info[i:i + batch_size]
+                if db.insert_stocks(batch):
+                    success_count += len(batch)
+                    logger.info(f"Inserted batch {i//batch_size + 1}: {len(batch)} stocks")
+                else:
+                    logger.error(f"Failed to insert batch {i//batch_size + 1}")
         
         if success_count > 0:
             logger.info(f"Stock metadata setup completed successfully: {success_count} stocks inserted")
+            db.refresh_materialized_views()
             db.close()
             return True
     
@@ -314,6 +317,7 @@ def setup_quick_stocks(stocks_list):
     logger.info(f"Inserting {len(stocks_list)} popular stocks into database...")
     if db.insert_stocks(stocks_list):
         logger.info("Popular stocks setup completed successfully")
+        db.refresh_materialized_views()
         db.close()
         return True
     
@@ -358,14 +362,31 @@ def load_historical_data():
     
     # Fetch historical data for symbols in database
     all_price_records = []
+    latest_dates = {}
+    up_to_date = 0
     
     for i, symbol in enumerate(symbols):
+        # Latest stored price of each symbol, looked up once per batch
+        if i % config.BATCH_SIZE == 0:
+            latest_dates = db.get_latest_price_dates(symbols[i:i + config.BATCH_SIZE])
+        
+        # Symbols with prices only need the days after their latest one
+        latest = latest_dates.get(symbol)
+        start_date = latest.date() + timedelta(days=1) if latest else None
+        if start_date and start_date > datetime.now().date():
+            logger.info(f"Historical data for {symbol} is up to date ({i+1}/{len(symbols)})")
+            up_to_date += 1
+            continue
+        
         logger.info(f"Fetching historical data for {symbol} ({i+1}/{len(symbols)})")
         
         # Retry logic
         for attempt in range(config.MAX_RETRIES):
             try:
-                df = fetcher.fetch_historical_data(symbol, period)
+                if start_date:
+                    df = fetcher.fetch_recent_data(symbol, start_date)
+                else:
+                    df = fetcher.fetch_historical_data(symbol, period)
                 if df is not None:
                     records = fetcher.convert_to_price_records(df)
                     all_price_records.extend(records)
@@ -387,17 +408,23 @@ def load_historical_data():
         
         # Insert in batches
         batch_size = config.BATCH_SIZE
-        for i in range(0, len(all_price_records), batch_size):
-            batch = all_price_records[i:i + batch_size]
-            if db.insert_stock_prices(batch):
-                logger.info(f"Inserted batch {i//batch_size + 1}")
-            else:
-                logger.error(f"Failed to insert batch {i//batch_size + 1}")
+        with db.bulk_mode():
+            for i in range(0, len(all_price_records), batch_size):
+                batch = all_price_records[i:i + batch_size]
+                if db.insert_stock_prices(batch):
+                    logger.info(f"Inserted batch {i//batch_size + 1}")
+                else:
+                    logger.error(f"Failed to insert batch {i//batch_size + 1}")
         
         logger.info("Historical data loading completed")
         db.close()
         return True
     
+    if up_to_date == len(symbols):
+        logger.info("Historical data is already up to date")
+        db.close()
+        return True
+    
     logger.error("Failed to load historical data")
     db.close()
     return False
@@ -4,7 +4,7 @@ import numpy as np
 import logging
 from datetime import datetime, timedelta
 from config import Config
-from database import TimescaleDBManager
+from database import TimescaleDBManager, enable_compression
 import psycopg2.extras
 import matplotlib.pyplot as plt
 from matplotlib.dates import DateFormatter
@@ -44,23 +44,35 @@ class EquiweightedIndexGenerator:
                     );
                 """)
                 
-                # Create hypertable
+                # Create hypertable; one value per index per day fits month-long
+                # chunks, so a year-long chart reads about 12 chunks instead of 52
                 cursor.execute("""
                     SELECT create_hypertable('equiweighted_indices', 'time', 
+                                           chunk_time_interval => INTERVAL '30 days',
                                            if_not_exists => TRUE);
                 """)
                 
+                # Existing hypertables use the new interval for chunks created from now on
+                cursor.execute("""
+                    SELECT set_chunk_time_interval('equiweighted_indices', INTERVAL '30 days');
+                """)
+                
                 # Create indices for better performance
                 cursor.execute("""
-                    CREATE INDEX IF NOT EXISTS idx_equiweighted_indices_name 
-                    ON equiweighted_indices (index_name);
+                    CREATE INDEX IF NOT EXISTS idx_eqi_name_time 
+                    ON equiweighted_indices (index_name, time DESC);
                 """)
                 
                 cursor.execute("""
-                    CREATE INDEX IF NOT EXISTS idx_equiweighted_indices_type 
-                    ON equiweighted_indices (index_type);
+                    CREATE INDEX IF NOT EXISTS idx_eqi_type_time 
+                    ON equiweighted_indices (index_type, time DESC);
                 """)
                 
+                # Same compression setup as equiweighted_index.py, past the
+                # window generate_all_indices rewrites
+                enable_compression(cursor, 'equiweighted_indices', 'index_name',
+                                   self.config.COMPRESS_AFTER_DAYS)
+                
                 self.db.connection.commit()
                 logger.info("Equiweighted indices table created successfully")
                 return True
@@ -77,13 +89,13 @@ class EquiweightedIndexGenerator:
         Generate equiweighted indices for sector-industry combinations only
         
         Args:
-            start_date: Start date for index calculation (defaults to 1 year ago)
+            start_date: Start date for index calculation (defaults to HISTORY_DAYS ago)
             end_date: End date for index calculation (defaults to today)
         """
         logger.info("Generating sector-industry combination indices only...")
         
         if start_date is None:
-            start_date = datetime.now() - timedelta(days=365)
+            start_date = datetime.now() - timedelta(days=self.config.HISTORY_DAYS)
         if end_date is None:
             end_date = datetime.now()
             
@@ -229,8 +241,9 @@ class EquiweightedIndexGenerator:
             # Convert to DataFrame
             df = pd.DataFrame(rows)
             
-            # Pivot to have symbols as columns
-            pivot_df = df.pivot(index='time', columns='symbol', values='close_price')
+            # Pivot to have symbols as columns; unstack reshapes the (time, symbol)
+            # index directly instead of going through pivot's generic path
+            pivot_df = df.set_index(['time', 'symbol'])['close_price'].unstack('symbol')
             
             return pivot_df
             
@@ -310,24 +323,31 @@ class EquiweightedIndexGenerator:
             return False
         
         try:
+            # Rows straight from the columns, without boxing each row in a Series
+            rows = [
+                (day, index_name, index_type, index_value, constituent_count)
+                for day, index_value in zip(
+                    index_values['time'].tolist(),
+                    index_values['index_value'].astype(float).tolist()
+                )
+            ]
+            
             # Insert index values in batches
             with self.db.connection.cursor() as cursor:
-                for _, row in index_values.iterrows():
-                    cursor.execute("""
-                        INSERT INTO equiweighted_indices
-                        (time, index_name, index_type, index_value, constituent_count)
-                        VALUES (%s, %s, %s, %s, %s)
-                        ON CONFLICT (time, index_name) 
-                        DO UPDATE SET 
-                            index_value = EXCLUDED.index_value,
-                            constituent_count = EXCLUDED.constituent_count
-                    """, (
-                        row['time'], 
-                        index_name, 
-                        index_type, 
-                        float(row['index_value']), 
-                        constituent_count
-                    ))
+                psycopg2.extras.execute_values(
+                    cursor,
+                    """
+                    INSERT INTO equiweighted_indices
+                    (time, index_name, index_type, index_value, constituent_count)
+                    VALUES %s
+                    ON CONFLICT (time, index_name) 
+                    DO UPDATE SET 
+                        index_value = EXCLUDED.index_value,
+                        constituent_count = EXCLUDED.constituent_count
+                    """,
+                    rows,
+                    page_size=1000
+                )
                 
                 self.db.connection.commit()
                 logger.info(f"Stored {len(index_values)} index values for {index_name}")
@@ -1,7 +1,7 @@
 import yfinance as yf
 import logging
 from typing import List, Dict
-from database import TimescaleDBManager
+from database import TimescaleDBManager, invalidate_stock_symbols
 from config import Config
 
 logger = logging.getLogger(__name__)
@@ -91,7 +91,10 @@ class StockValidator:
                     )
                     
                     db.connection.commit()
+                    invalidate_stock_symbols()
                     logger.info(f"Removed {len(invalid_symbols)} invalid symbols from database")
+                
+                db.refresh_materialized_views()
             else:
                 logger.info("All symbols in database are valid")
             
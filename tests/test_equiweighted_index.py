@@ -0,0 +1,58 @@
+"""
+Tests for EquiweightedIndexGenerator against a live PostgreSQL database
+
+Configured through the usual DB_* environment variables; skipped when no
+database is reachable. Fixtures live in temp tables that shadow stocks and
+stock_prices for the test session only, so no real data is touched.
+"""
+import os
+import sys
+from datetime import datetime
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from equiweighted_index import EquiweightedIndexGenerator  # noqa: E402
+
+@pytest.fixture
+def generator():
+    generator = EquiweightedIndexGenerator()
+    if not generator.db.connect():
+        pytest.skip("No database available")
+
+    with generator.db.connection.cursor() as cursor:
+        cursor.execute("""
+            CREATE TEMP TABLE stocks (
+                symbol VARCHAR(50) PRIMARY KEY,
+                sector VARCHAR(100),
+                industry VARCHAR(100)
+            );
+            CREATE TEMP TABLE stock_prices (
+                time TIMESTAMPTZ NOT NULL,
+                symbol VARCHAR(50) NOT NULL,
+                close_price REAL NOT NULL
+            );
+        """)
+    yield generator
+    generator.db.close()
+
+def test_zero_close_does_not_abort_category_returns(generator):
+    with generator.db.connection.cursor() as cursor:
+        cursor.execute("""
+            INSERT INTO stocks VALUES ('AAA', 'Tech', 'Software'), ('BBB', 'Tech', 'Software');
+            INSERT INTO stock_prices VALUES
+                ('2024-01-01', 'AAA', 10), ('2024-01-02', 'AAA', 0), ('2024-01-03', 'AAA', 5),
+                ('2024-01-01', 'BBB', 20), ('2024-01-02', 'BBB', 22), ('2024-01-03', 'BBB', 22);
+        """)
+
+    returns = generator._get_category_returns(datetime(2024, 1, 1), datetime(2024, 1, 3))
+
+    sector = returns[('sector', 'Tech', None)]
+    assert sector['starts'].tolist() == [2, 0, 0]
+    # AAA falls to zero on day 2 (-100%); its return off that zero close on
+    # day 3 is left out instead of raising division by zero
+    assert sector['return_sum'].tolist() == pytest.approx([0.0, -1.0 + 0.1, 0.0])
+
+    index = generator._calculate_equiweighted_index(sector)
+    assert index['index_value'].tolist() == pytest.approx([1000.0, 550.0, 550.0])
@@ -0,0 +1,25 @@
+"""
+Production entry point for the API
+
+Run with gevent workers so requests waiting on PostgreSQL yield to each other:
+
+    gunicorn -k gevent -w $(nproc) -b 0.0.0.0:5000 --worker-connections 1000 wsgi:app
+
+Requests beyond DB_POOL_MAX queue on the pool instead of failing, so the
+worker connection count does not need to match the pool size.
+
+Behind pgbouncer in transaction pooling mode, point DB_HOST/DB_PORT at
+pgbouncer, set DB_PREPARE_STATEMENTS=false and keep the per-worker pool
+small (e.g. DB_POOL_MIN=1, DB_POOL_MAX=5). Each worker holds at most
+DB_POOL_MAX connections for requests plus DB_POOL_MIN for background work
+(view refreshes and index generation).
+"""
+from psycogreen.gevent import patch_psycopg
+
+# Make psycopg2 wait on sockets cooperatively before any connection is opened
+patch_psycopg()
+
+from api_server import app, start_materialized_view_refresh  # noqa: E402
+
+# One refresh loop per worker; they take turns through an advisory lock
+start_materialized_view_refresh()